@@ -1,25 +1,32 @@
 # batik_streamlit_app.py
+import time
+# Taken before anything else is imported, for the time-to-first-paint figure
+SCRIPT_STARTED = time.perf_counter()
+
 import streamlit as st
-import cv2
 import os
-from PIL import Image
-import numpy as np
-import tempfile
-import base64
-from ultralytics import YOLO
-from gtts import gTTS
 import io
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from story_store import get_story_store
+from model_registry import get_registry
+from prediction_cache import get_prediction_cache, model_identity
+from audio_cache import get_audio_cache, narration_text
+from tts_backends import available_backends, get_backend, stream_synthesis
+from model_backends import resolve_weights
+from inference_client import INFERENCE_URL_ENV, InferenceClient
+from inference_pool import InferenceBusy, get_inference_pool
+from story_cards import get_card_renderer
+# image_pipeline, tiling and stream_mode (PIL, numpy, cv2) and ultralytics are
+# imported where they are first needed, so the first paint never waits on them
+
+MODEL_PATH = "runs/classify/batik_75epochsv2/weights/best.pt"
 
-# Set page configuration
-st.set_page_config(
-    page_title="Malaysian Batik Storyteller",
-    page_icon="🌸",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# Byte-sized buckets for the payload histograms
+PAYLOAD_BUCKETS = (256, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
 
 # Custom CSS for better fonts and styling
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap');
     
@@ -124,100 +131,92 @@ st.markdown("""
         text-align: center;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-# Database (copied from your original code)
-BATIK_DATABASE = {
-    "corak batik bunga raya": {
-        "en": {
-            "name": "Bunga Raya (Hibiscus) Batik Pattern",
-            "story": "The Bunga Raya (Hibiscus) motif is a prominent and culturally significant pattern in Malaysian batik. As Malaysia's national flower, it represents love for the nation and its rich heritage. The five petals often symbolize the five principles of Rukun Negara (Malaysian National Principles), representing unity among the diverse population.",
-            "meaning": "National Identity, Unity, Love, Growth, Vitality",
-            "origin": "Malaysia (Various states including Kelantan, Terengganu)",
-            "cultural_significance": "National flower of Malaysia, symbol of unity and pride",
-            "home_context": "In many Malaysian houses, the hibiscus tree is commonly planted in home gardens, along fences, near verandas, or beside village houses. The tree does not usually grow very tall, which makes it easy to maintain.",
-            "artistic_expression": "Artisans incorporate the bunga raya in various ways, blending tradition with contemporary creativity. The designs often feature vibrant reds and yellows, adding a fresh, bright appearance to the fabric.",
-            "essence": "The bunga raya pattern is more than just a beautiful floral design; it is a visual language that connects the wearer to the shared history, values, and natural beauty of Malaysia."
-        },
-        "ms": {
-            "name": "Corak Batik Bunga Raya",
-            "story": "Motif Bunga Raya (Hibiscus) adalah corak yang menonjol dan bermakna dalam budaya batik Malaysia. Sebagai bunga kebangsaan Malaysia, ia melambangkan cinta kepada negara dan warisannya yang kaya. Lima kelopak bunga sering melambangkan lima prinsip Rukun Negara, mewakili perpaduan dalam kalangan penduduk yang pelbagai.",
-            "meaning": "Identiti Nasional, Perpaduan, Cinta, Pertumbuhan, Vitaliti",
-            "origin": "Malaysia (Negeri-negeri termasuk Kelantan, Terengganu)",
-            "cultural_significance": "Bunga kebangsaan Malaysia, simbol perpaduan dan kebanggaan",
-            "home_context": "Di banyak rumah Malaysia, pokok bunga raya (hibiscus) adalah kehadiran yang biasa dan bermakna. Ia biasanya ditanam di taman rumah, sepanjang pagar, berhampiran veranda, atau di sebelah rumah kampung. Pokok ini biasanya tidak tumbuh sangat tinggi, menjadikannya mudah dijaga.",
-            "artistic_expression": "Pembuat batik menggabungkan bunga raya dalam pelbagai cara, menggabungkan tradisi dengan kreativiti kontemporari. Reka bentuk sering menampilkan warna merah dan kuning yang terang, menambah penampilan segar dan cerah pada kain.",
-            "essence": "Corak bunga raya bukan sekadar reka bentuk bunga yang cantik; ia adalah bahasa visual yang menghubungkan pemakai dengan sejarah, nilai, dan keindahan semula jadi Malaysia yang dikongsi bersama."
-        },
-        "zh-cn": {
-            "name": "大红花（木槿）蜡染图案",
-            "story": "大红花（木槿）图案是马来西亚蜡染中突出且具有文化意义的图案。作为马来西亚的国花，它代表着对国家和丰富遗产的热爱。五片花瓣通常象征着国家原则（Rukun Negara）的五项原则，代表着多元人口之间的团结。",
-            "meaning": "国家身份、团结、爱、成长、活力",
-            "origin": "马来西亚（包括吉兰丹、登嘉楼等各州）",
-            "cultural_significance": "马来西亚国花，团结和自豪的象征",
-            "home_context": "在许多马来西亚房屋中，大红花（木槿）树是熟悉且有意义的植物。它通常种植在家庭花园、栅栏旁、走廊附近或乡村房屋旁。这种树通常不会长得很高，这使得它易于维护。",
-            "artistic_expression": "工匠们以各种方式融入大红花，将传统与当代创造力相结合。设计通常采用鲜艳的红色和黄色，为织物增添清新明亮的外观。",
-            "essence": "大红花图案不仅仅是一个美丽的花卉设计；它是一种视觉语言，将穿着者与马来西亚共同的历史、价值观和自然美景联系起来。"
-        }
-    },
-    "corak batik geometri": {
-        "en": {
-            "name": "Geometric Batik Pattern",
-            "story": "In Malaysian Batik, geometric patterns represent a fusion of spiritual balance, cultural heritage, and the logic of the natural world. While roughly 30% of Malaysian batik designs are geometric, they hold a significant narrative role in the country's textile history.",
-            "meaning": "Order, Symmetry, Harmony, Balance, Wisdom, Divine Connection",
-            "origin": "Malaysia (Kelantan, Terengganu - East Coast)",
-            "cultural_significance": "Represents Islamic artistic traditions and cultural identity",
-            "islamic_influence": "Because Islamic norms traditionally discourage the representation of human or animal figures, Malaysian artisans turned to geometry to express divine order. The repetitive use of circles, squares, and diamonds reflects the balance and harmony found in the universe.",
-            "motifs_stories": "• Geometric Spirals (18% of popular patterns): Represent eternal growth and interconnectedness of life.\n• Awan Larat (Cloud Pattern): Structured repetition serving as a 'cultural chronicle', symbolizing unity between generations.\n• Diamonds and Zigzags: Used in sarong borders, providing structure to fluid central designs.",
-            "regional_heritage": "Kelantan and Terengganu are the heartlands of Malaysian batik. In the 1920s, Haji Che Su revolutionized Malaysian batik by inventing metal stamps (cap) for consistent reproduction of intricate geometric patterns. Unlike earthy Javanese tones, Malaysian geometric batik uses vibrant tropical colors (pinks, purples, blues) reflecting the coastal environment.",
-            "artistic_expression": "Geometric patterns were historically favored by royalty, scholars, and merchants as symbols of higher social standing, wisdom, and clarity. They showcase mathematical precision combined with cultural storytelling.",
-            "essence": "Geometric patterns in Malaysian batik are more than decorative elements; they are visual mathematics that connect the wearer to spiritual principles, cultural heritage, and the structured beauty of the natural world."
-        },
-        "ms": {
-            "name": "Corak Batik Geometri",
-            "story": "Dalam Batik Malaysia, corak geometri mewakili gabungan keseimbangan spiritual, warisan budaya, dan logik dunia semula jadi. Walaupun kira-kira 30% reka bentuk batik Malaysia adalah geometri, mereka memainkan peranan naratif yang penting dalam sejarah tekstil negara.",
-            "meaning": "Susunan, Simetri, Keharmonian, Keseimbangan, Kebijaksanaan, Hubungan Ilahi",
-            "origin": "Malaysia (Kelantan, Terengganu - Pantai Timur)",
-            "cultural_significance": "Mewakili tradisi seni Islam dan identiti budaya",
-            "islamic_influence": "Oleh kerana norma Islam secara tradisional menghalang penggambaran figura manusia atau haiwan, tukang batik Malaysia beralih kepada geometri untuk meluahkan susunan ilahi. Penggunaan berulang bulatan, segi empat sama, dan berlian mencerminkan keseimbangan dan keharmonian yang terdapat dalam alam semesta.",
-            "motifs_stories": "• Lingkaran Geometri (18% corak popular): Mewakili pertumbuhan abadi dan saling berkaitan kehidupan.\n• Awan Larat (Corak Awan): Pengulangan berstruktur berfungsi sebagai 'kronik budaya', melambangkan perpaduan antara generasi.\n• Berlian dan Zigzag: Digunakan dalam sempadan sarung, memberikan struktur kepada reka bentuk pusat yang lebih cair.",
-            "regional_heritage": "Kelantan dan Terengganu adalah pusat batik Malaysia. Pada 1920-an, Haji Che Su merevolusikan batik Malaysia dengan mencipta cap logam untuk penghasilan corak geometri rumit yang konsisten. Berbeza dengan warna-warna tanah Jawa, batik geometri Malaysia menggunakan warna tropika terang (merah jambu, ungu, biru) yang mencerminkan persekitaran pantai.",
-            "artistic_expression": "Corak geometri secara sejarah digemari oleh golongan bangsawan, cendekiawan, dan pedagang sebagai simbol status sosial yang lebih tinggi, kebijaksanaan, dan kejelasan. Ia mempamerkan ketepatan matematik digabungkan dengan penceritaan budaya.",
-            "essence": "Corak geometri dalam batik Malaysia bukan sekadar elemen hiasan; ia adalah matematik visual yang menghubungkan pemakai dengan prinsip spiritual, warisan budaya, dan keindahan berstruktur dunia semula jadi."
-        },
-        "zh-cn": {
-            "name": "几何蜡染图案",
-            "story": "在马来西亚蜡染中，几何图案代表着精神平衡、文化遗产和自然世界逻辑的融合。虽然大约30%的马来西亚蜡染设计是几何图案，但它们在国家的纺织历史中扮演着重要的叙事角色。",
-            "meaning": "秩序、对称、和谐、平衡、智慧、神圣连接",
-            "origin": "马来西亚（吉兰丹、登嘉楼 - 东海岸）",
-            "cultural_significance": "代表伊斯兰艺术传统和文化认同",
-            "islamic_influence": "由于伊斯兰规范传统上不鼓励表现人物或动物形象，马来西亚工匠转向几何来表达神圣秩序。圆形、正方形和菱形的重复使用反映了宇宙中的平衡与和谐。",
-            "motifs_stories": "• 几何螺旋（热门图案的18%）：代表永恒成长和生命的相互联系。\n• Awan Larat（云纹图案）：结构化重复充当「文化编年史」，象征代际间的团结。\n• 菱形和锯齿纹：用于纱笼的边框，为更流畅的中心设计提供结构。",
-            "regional_heritage": "吉兰丹和登嘉楼是马来西亚蜡染的中心地带。1920年代，哈吉·切苏发明了金属印章（cap），能够一致复制复杂的几何图案，从而革新了马来西亚蜡染。与爪哇的土色调不同，马来西亚几何蜡染使用反映海岸环境的鲜艳热带色彩（粉红色、紫色、蓝色）。",
-            "artistic_expression": "几何图案历史上受到皇室、学者和商人的青睐，作为更高社会地位、智慧和清晰的象征。它们展示了数学精度与文化叙事的结合。",
-            "essence": "马来西亚蜡染中的几何图案不仅仅是装饰元素；它们是视觉数学，将佩戴者与精神原则、文化遗产和自然世界的结构化美联系起来。"
-        }
-    }
-}
+def setup_page():
+    """Page configuration and styling; must run before any other st call"""
+    # Set page configuration
+    st.set_page_config(
+        page_title="Malaysian Batik Storyteller",
+        page_icon="🌸",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    # Sent once per session: the style tag lives in the page <head>, so it outlives reruns
+    css_bytes = 0
+    if not st.session_state.get('css_injected'):
+        css_bytes = inject_css(CUSTOM_CSS)
+        st.session_state['css_injected'] = True
+    st.session_state['css_bytes'] = css_bytes
+    metrics.observe("batik_payload_bytes", css_bytes, buckets=PAYLOAD_BUCKETS, part="css")
+
+def inject_css(css):
+    """Add the app's <style> block to the parent page's <head>; returns the bytes sent.
+    
+    CSS sent with st.markdown is an element like any other, so Streamlit
+    drops it unless every rerun sends it again. A style tag appended to
+    the document head by a zero-height component stays for the session.
+    """
+    import json
+    import streamlit.components.v1 as components
+    
+    css = css.replace("<style>", "").replace("</style>", "").strip()
+    script = ("<script>const doc = window.parent.document;"
+              "if (!doc.getElementById('batik-css')) {"
+              "const style = doc.createElement('style'); style.id = 'batik-css';"
+              f"style.textContent = {json.dumps(css)}; doc.head.appendChild(style);"
+              "}</script>")
+    components.html(script, height=0)
+    return len(script.encode("utf-8"))
 
-SUPPORTED_LANGUAGES = {
-    'en': 'English 🇬🇧',
-    'ms': 'Malay 🇲🇾',
-    'zh-cn': 'Chinese 🇨🇳'
-}
+# Stories live in stories/<lang>.json and are loaded once per process
+SUPPORTED_LANGUAGES = get_story_store().languages
 
 class BatikStoryTeller:
-    def __init__(self, model_path="runs/classify/batik_75epochsv2/weights/best.pt"):
+    def __init__(self, model_path=MODEL_PATH, tts_backend=None, backend=None, cascade_threshold=None):
+        from cascade import configured_threshold
+        from image_pipeline import DEFAULT_MODEL_SIZE
+        
         self.model = None
+        self.model_path = model_path
+        self.backend = backend
+        self.model_size = DEFAULT_MODEL_SIZE
+        self.model_id = None
+        self.prediction_cache = get_prediction_cache()
         self.class_names = {}
         self.current_language = 'en'
+        self.tts_backend = get_backend(tts_backend)
+        self.last_audio_timing = None
+        # Called with the queue position while a prediction waits for a worker
+        self.queue_listener = None
+        # Cascade mode (BATIK_CASCADE_THRESHOLD): a cheap first stage answers confident cases
+        self.cascade_threshold = cascade_threshold if cascade_threshold is not None else configured_threshold()
+        self.first_stage = None
+        
+        self._load_model(model_path)
+    
+    def _load_model(self, model_path):
+        from image_pipeline import model_input_size
         
-        # Try to load model
+        # Try to load model (shared across sessions, loaded once per weights file)
         try:
             if os.path.exists(model_path):
-                self.model = YOLO(model_path)
+                if self.cascade_threshold is not None:
+                    from cascade import get_first_stage, head_path_for
+                    self.first_stage = get_first_stage(head_path_for(model_path))
+                # torch, onnxruntime or openvino (BATIK_MODEL_BACKEND); torch if not exported
+                model_path, self.backend = resolve_weights(model_path, self.backend)
+                self.model_path = model_path
+                self.model = get_registry().get(model_path)
                 self.class_names = self.model.names if hasattr(self.model, 'names') else {}
-                st.success(f"✅ Model loaded successfully")
+                # Model class names resolve to stories through the alias index
+                get_story_store().register_classes(self.class_names)
+                self.model_size = model_input_size(self.model)
+                self.model_id = model_identity(model_path)
+                # Results from older weights at this path must never be served
+                self.prediction_cache.invalidate_model(model_path, keep=self.model_id)
+                st.success(f"✅ Model loaded successfully ({self.backend})")
             else:
                 st.warning(f"⚠️ Model file not found at: {model_path}")
                 st.info("Running in demo mode with sample stories.")
@@ -227,129 +226,548 @@ class BatikStoryTeller:
     
     def classify_image(self, image_file):
         """Classify batik pattern in uploaded image"""
+        metrics.inc("batik_requests_total", kind="classify")
         try:
-            if self.model is None:
-                # Demo mode - simulate classification based on filename
-                filename = image_file.name.lower()
-                if 'bunga' in filename or 'raya' in filename or 'flower' in filename:
-                    return {
-                        'primary_class': 'corak batik bunga raya',
-                        'confidence': 0.95,
-                        'class_id': 0,
-                        'image_array': Image.open(image_file)
-                    }
-                elif 'geometri' in filename or 'geometric' in filename:
-                    return {
-                        'primary_class': 'corak batik geometri',
-                        'confidence': 0.92,
-                        'class_id': 1,
-                        'image_array': Image.open(image_file)
-                    }
-                else:
-                    # Random selection for demo
-                    import random
-                    pattern = random.choice(['corak batik bunga raya', 'corak batik geometri'])
-                    return {
-                        'primary_class': pattern,
-                        'confidence': 0.88,
-                        'class_id': 0 if 'bunga' in pattern else 1,
-                        'image_array': Image.open(image_file)
-                    }
+            # Decode once, at model size (accepts an already prepared image)
+            with metrics.span("decode"):
+                prepared = self.prepare(image_file)
             
-            # Real classification with YOLO
-            image = Image.open(image_file)
-            image_array = np.array(image)
+            if self.model is None:
+                metrics.inc("batik_demo_fallbacks_total")
+                return self._demo_classify(prepared)
             
-            # Run prediction
-            results = self.model.predict(image_array, verbose=False)
+            # Same bytes + same weights = same answer
+            with metrics.span("cache_lookup"):
+                cached = self._cached_result(prepared)
+            if cached:
+                metrics.inc("batik_cache_hits_total", cache="prediction")
+                return cached
+            metrics.inc("batik_cache_misses_total", cache="prediction")
             
-            if results:
-                result = results[0]
-                if hasattr(result, 'probs'):
-                    probs = result.probs
-                    top1_idx = probs.top1
-                    confidence = probs.top1conf.item()
-                    
-                    if top1_idx in self.class_names:
-                        class_name = self.class_names[top1_idx]
-                    else:
-                        class_name = f"Class_{top1_idx}"
-                    
+            # Cascade: the first stage answers on its own when it is confident enough
+            fast_seconds = None
+            if self.first_stage is not None:
+                start = time.perf_counter()
+                with metrics.span("first_stage"):
+                    class_id, confidence = self.first_stage.predict_proba(prepared.model_array)
+                fast_seconds = time.perf_counter() - start
+                if confidence >= self.cascade_threshold:
+                    metrics.inc("batik_cascade_total", stage="first")
+                    self.first_stage.record(False, fast_seconds)
+                    # Not stored in the prediction cache, which only holds full-model answers
                     return {
-                        'primary_class': class_name,
+                        'primary_class': self.class_names.get(class_id, f"Class_{class_id}"),
                         'confidence': confidence,
-                        'class_id': top1_idx,
-                        'image_array': image_array
+                        'class_id': class_id,
+                        'image_array': prepared.model_array,
+                        'thumbnail': prepared.thumbnail,
+                        'stage': 'first'
                     }
+                metrics.inc("batik_cascade_total", stage="escalated")
+            
+            # Run prediction (on the shared, bounded worker pool)
+            start = time.perf_counter()
+            results = self._predict(prepared.model_array)
+            if fast_seconds is not None:
+                self.first_stage.record(True, fast_seconds, time.perf_counter() - start)
+            
+            if results:
+                with metrics.span("postprocess"):
+                    return self._store_result(self._build_result(results[0], prepared), prepared)
             
             return None
             
+        except InferenceBusy as e:
+            st.warning(f"⏳ The model is busy right now ({e}). Please try again in a moment.")
+            return None
         except Exception as e:
+            metrics.inc("batik_errors_total", stage="classify_image")
             st.error(f"Error classifying image: {e}")
             return None
     
-    def get_story(self, batik_class):
-        """Get storytelling for detected batik pattern"""
-        batik_class_lower = batik_class.lower().strip()
-        
-        # Direct match
-        if batik_class_lower in BATIK_DATABASE:
-            if self.current_language in BATIK_DATABASE[batik_class_lower]:
-                return BATIK_DATABASE[batik_class_lower][self.current_language]
-        
-        # Partial matches
-        if 'bunga' in batik_class_lower or 'raya' in batik_class_lower:
-            if "corak batik bunga raya" in BATIK_DATABASE:
-                if self.current_language in BATIK_DATABASE["corak batik bunga raya"]:
-                    return BATIK_DATABASE["corak batik bunga raya"][self.current_language]
-        
-        if 'geometri' in batik_class_lower:
-            if "corak batik geometri" in BATIK_DATABASE:
-                if self.current_language in BATIK_DATABASE["corak batik geometri"]:
-                    return BATIK_DATABASE["corak batik geometri"][self.current_language]
-        
-        # Default story
-        default_stories = {
-            'en': {
-                'name': f"{batik_class}",
-                'story': f"This appears to be a {batik_class} pattern. Batik is a traditional wax-resist dyeing technique. Each pattern has unique cultural significance in Malaysian heritage.",
-                'meaning': "Cultural Heritage, Tradition, Artistry",
-                'origin': "Malaysia",
-                'cultural_significance': "Part of UNESCO Intangible Cultural Heritage"
-            },
-            'ms': {
-                'name': f"{batik_class}",
-                'story': f"Ini adalah corak {batik_class}. Batik adalah teknik pewarnaan tradisional dengan lilin tahan warna. Setiap corak mempunyai makna budaya yang unik dalam warisan Malaysia.",
-                'meaning': "Warisan Budaya, Tradisi, Seni",
-                'origin': "Malaysia",
-                'cultural_significance': "Sebahagian daripada Warisan Budaya Tak Ketara UNESCO"
+    def classify_many(self, image_files, batch_size=8, decode_workers=4):
+        """Classify several uploaded images, running YOLO on real batches.
+        
+        Images are decoded concurrently one batch at a time, so only
+        ``batch_size`` decoded images are held in memory at once. Returns one
+        result dict per input, in input order (None where an image failed).
+        """
+        image_files = list(image_files)
+        if self.model is None:
+            return [self.classify_image(image_file) for image_file in image_files]
+        metrics.inc("batik_requests_total", len(image_files), kind="classify_many")
+        
+        results = [None] * len(image_files)
+        batch_size = max(1, int(batch_size))
+        with ThreadPoolExecutor(max_workers=max(1, decode_workers)) as pool:
+            for start in range(0, len(image_files), batch_size):
+                batch_files = image_files[start:start + batch_size]
+                with metrics.span("decode_batch"):
+                    decoded = list(pool.map(self._safe_prepare, batch_files))
+                
+                indices = []
+                for i, prepared in enumerate(decoded):
+                    if prepared is None:
+                        continue
+                    cached = self._cached_result(prepared)
+                    if cached:
+                        metrics.inc("batik_cache_hits_total", cache="prediction")
+                        results[start + i] = cached
+                    else:
+                        indices.append(start + i)
+                
+                batch = [decoded[i - start].model_array for i in indices]
+                if not batch:
+                    continue
+                
+                try:
+                    predictions = self._predict(batch, stage="predict_batch")
+                except Exception as e:
+                    metrics.inc("batik_errors_total", stage="classify_many")
+                    st.error(f"Error classifying images: {e}")
+                    continue
+                
+                for index, prediction in zip(indices, predictions):
+                    prepared = decoded[index - start]
+                    results[index] = self._store_result(self._build_result(prediction, prepared), prepared)
+        
+        return results
+    
+    def classify_tiles(self, image_file, tile_size=None, stride=None, batch_size=None, max_side=None):
+        """Classify overlapping tiles of a large scan into a class-probability grid.
+        
+        Returns the grid (rows x cols x classes), the per-pattern area
+        share and a heatmap overlay on the thumbnail, or None in demo mode.
+        Unset sizes fall back to the tiling/image_pipeline defaults.
+        """
+        from image_pipeline import DEFAULT_SCAN_SIDE, decode_scan
+        from tiling import (DEFAULT_STRIDE, DEFAULT_TILE_BATCH, DEFAULT_TILE_SIZE,
+                            area_share, classify_tiles, heatmap_overlay)
+        
+        if self.model is None:
+            return None
+        tile_size = tile_size or DEFAULT_TILE_SIZE
+        stride = stride or DEFAULT_STRIDE
+        batch_size = batch_size or DEFAULT_TILE_BATCH
+        max_side = max_side or DEFAULT_SCAN_SIDE
+        try:
+            with metrics.span("decode_scan"):
+                scan, thumbnail, scale = decode_scan(image_file, max_side=max_side)
+            # Each tile batch queues on the pool separately, so other sessions' requests
+            # run in between instead of waiting behind the whole scan
+            grid, positions, tile = classify_tiles(
+                self.model, scan, tile_size, stride, batch_size,
+                predict=lambda tiles: self._predict(tiles, stage="predict_tiles")
+            )
+            
+            shares = area_share(grid)
+            return {
+                'grid': grid,
+                'positions': positions,
+                'tile_size': tile,
+                'stride': stride,
+                'scale': scale,
+                'area_share': {
+                    self.class_names.get(class_id, f"Class_{class_id}"): float(share)
+                    for class_id, share in enumerate(shares)
+                },
+                'heatmap': heatmap_overlay(thumbnail, grid)
             }
-        }
+        except Exception as e:
+            metrics.inc("batik_errors_total", stage="classify_tiles")
+            st.error(f"Error analysing tiles: {e}")
+            return None
+    
+    def _predict(self, inputs, stage="predict"):
+        """model.predict on the shared inference pool (queue wait and compute timed separately)"""
+        return get_inference_pool().run(self.model.predict, inputs, verbose=False,
+                                        stage=stage, on_wait=self.queue_listener)
+    
+    def find_similar(self, prepared, k=6):
+        """Pieces from the collection that look most like this image ([] without a model or index)"""
+        from similarity_index import extract_embeddings, get_similarity_index
+        
+        index = get_similarity_index()
+        if self.model is None or index is None or len(index) == 0:
+            return []
+        try:
+            vectors = get_inference_pool().run(extract_embeddings, self.model, [prepared.model_array],
+                                               stage="embed", on_wait=self.queue_listener)
+            with metrics.span("similarity_search"):
+                # The upload itself may already be in the collection (under any path)
+                return index.search(vectors[0], k, exclude_hash=prepared.content_hash)
+        except Exception as e:
+            metrics.inc("batik_errors_total", stage="find_similar")
+            st.warning(f"Could not search for similar pieces: {e}")
+            return []
+    
+    def prepare(self, image_file):
+        """Decode an upload into a model-sized array plus a display thumbnail"""
+        from image_pipeline import PreparedImage, prepare_image
+        
+        if isinstance(image_file, PreparedImage):
+            return image_file
+        return prepare_image(image_file, model_size=self.model_size)
+    
+    def _safe_prepare(self, image_file):
+        try:
+            return self.prepare(image_file)
+        except Exception as e:
+            st.error(f"Error reading {getattr(image_file, 'name', 'image')}: {e}")
+            return None
+    
+    def _cached_result(self, prepared):
+        """Look up a previous prediction for these exact bytes and weights"""
+        if self.model_id is None or prepared.content_hash is None:
+            return None
+        cached = self.prediction_cache.get(prepared.content_hash, self.model_id)
+        if cached is None:
+            return None
+        cached['image_array'] = prepared.model_array
+        cached['thumbnail'] = prepared.thumbnail
+        cached['cached'] = True
+        return cached
+    
+    def _store_result(self, result, prepared):
+        if result and self.model_id is not None and prepared.content_hash is not None:
+            self.prediction_cache.put(prepared.content_hash, self.model_id, result)
+        return result
+    
+    def _build_result(self, result, prepared):
+        """Turn one YOLO classification result into our result dict"""
+        if not hasattr(result, 'probs'):
+            return None
+        
+        probs = result.probs
+        top1_idx = probs.top1
+        confidence = probs.top1conf.item()
         
-        if self.current_language in default_stories:
-            return default_stories[self.current_language]
+        if top1_idx in self.class_names:
+            class_name = self.class_names[top1_idx]
+        else:
+            class_name = f"Class_{top1_idx}"
         
-        # Fallback to English
-        return default_stories['en']
+        return {
+            'primary_class': class_name,
+            'confidence': confidence,
+            'class_id': top1_idx,
+            'image_array': prepared.model_array,
+            'thumbnail': prepared.thumbnail
+        }
+    
+    def _demo_classify(self, prepared):
+        """Demo mode - simulate classification based on filename"""
+        filename = prepared.name.lower()
+        if 'bunga' in filename or 'raya' in filename or 'flower' in filename:
+            return {
+                'primary_class': 'corak batik bunga raya',
+                'confidence': 0.95,
+                'class_id': 0,
+                'image_array': prepared.model_array,
+                'thumbnail': prepared.thumbnail
+            }
+        elif 'geometri' in filename or 'geometric' in filename:
+            return {
+                'primary_class': 'corak batik geometri',
+                'confidence': 0.92,
+                'class_id': 1,
+                'image_array': prepared.model_array,
+                'thumbnail': prepared.thumbnail
+            }
+        else:
+            # Random selection for demo
+            import random
+            pattern = random.choice(['corak batik bunga raya', 'corak batik geometri'])
+            return {
+                'primary_class': pattern,
+                'confidence': 0.88,
+                'class_id': 0 if 'bunga' in pattern else 1,
+                'image_array': prepared.model_array,
+                'thumbnail': prepared.thumbnail
+            }
+    
+    def get_story(self, batik_class, language=None):
+        """Get storytelling for detected batik pattern"""
+        with metrics.span("story_lookup"):
+            return get_story_store().story(batik_class, language or self.current_language)
     
     def generate_audio(self, story_data):
         """Generate audio for the story"""
         try:
-            audio_text = f"{story_data['name']}. {story_data['story']}"
-            tts = gTTS(text=audio_text, lang=self.current_language)
-            
-            # Save to bytes
-            audio_bytes = io.BytesIO()
-            tts.write_to_fp(audio_bytes)
-            audio_bytes.seek(0)
-            
-            return audio_bytes
+            chunks = list(self.stream_audio(story_data))
+            return io.BytesIO(self.tts_backend.join(chunks))
         except Exception as e:
             st.error(f"Error generating audio: {e}")
             return None
+    
+    def stream_audio(self, story_data):
+        """Yield the story audio chunk by chunk, as soon as each chunk is ready.
+        
+        Cached narration comes back as a single chunk. Otherwise sentences
+        are synthesized in parallel and the joined result is cached once the
+        last chunk arrives. Timings end up in ``last_audio_timing``.
+        """
+        audio_text = narration_text(story_data)
+        cache = get_audio_cache(self.tts_backend)
+        start = time.perf_counter()
+        
+        metrics.inc("batik_requests_total", kind="audio")
+        
+        # Served from disk when this story was narrated (or pre-rendered) before
+        cached = cache.get(self.current_language, audio_text)
+        if cached is not None:
+            metrics.inc("batik_cache_hits_total", cache="audio")
+            self._record_audio_timing(start, start, 1, cached=True)
+            yield cached
+            return
+        
+        metrics.inc("batik_cache_misses_total", cache="audio")
+        chunks = []
+        first_chunk_at = None
+        for chunk in stream_synthesis(self.tts_backend, audio_text, self.current_language):
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            chunks.append(chunk)
+            yield chunk
+        
+        self._record_audio_timing(start, first_chunk_at, len(chunks), cached=False)
+        if chunks:
+            cache.put(self.current_language, audio_text, self.tts_backend.join(chunks))
+    
+    def _record_audio_timing(self, start, first_chunk_at, chunks, cached):
+        now = time.perf_counter()
+        # Spans cannot wrap a generator's yields, so record these directly. First audio is
+        # a milestone inside tts_total, so only the total goes into the request trace
+        metrics.observe("batik_stage_seconds", (first_chunk_at or now) - start, stage="tts_first_audio")
+        metrics.record("tts_total", now - start)
+        self.last_audio_timing = {
+            'backend': self.tts_backend.name,
+            'time_to_first_audio': (first_chunk_at or now) - start,
+            'total_seconds': now - start,
+            'chunks': chunks,
+            'cached': cached,
+        }
+
+class RemoteStoryTeller(BatikStoryTeller):
+    """BatikStoryTeller that sends classification and story lookup to inference_service.py.
+    
+    Uploads are still decoded here (for the thumbnail) and only the small
+    model-sized array crosses the wire. Audio is generated locally.
+    """
+    
+    def __init__(self, service_url, tts_backend=None, max_parallel_requests=8):
+        self.client = InferenceClient(service_url)
+        self.max_parallel_requests = max_parallel_requests
+        super().__init__(model_path=None, tts_backend=tts_backend)
+    
+    def _load_model(self, model_path):
+        # The service owns the model
+        pass
+    
+    def classify_image(self, image_file):
+        """Classify batik pattern in uploaded image"""
+        try:
+            prepared = self.prepare(image_file)
+            response = self.client.classify_array(prepared.model_array, prepared.name)
+            return dict(response, image_array=prepared.model_array, thumbnail=prepared.thumbnail)
+        except Exception as e:
+            st.error(f"Error classifying image: {e}")
+            return None
+    
+    def classify_many(self, image_files, batch_size=8, decode_workers=4):
+        """Send images concurrently; the service batches them together"""
+        with ThreadPoolExecutor(max_workers=self.max_parallel_requests) as pool:
+            return list(pool.map(self.classify_image, image_files))
+    
+    def get_story(self, batik_class, language=None):
+        """Get storytelling for detected batik pattern"""
+        try:
+            with metrics.span("story_lookup_remote"):
+                return self.client.story(batik_class, language or self.current_language)
+        except Exception:
+            # Stories are bundled with the app, so we can still answer locally
+            return super().get_story(batik_class, language)
+
+def create_storyteller(tts_backend=None):
+    """A local storyteller, or a thin client when BATIK_INFERENCE_URL is set"""
+    service_url = os.environ.get(INFERENCE_URL_ENV)
+    if service_url:
+        return RemoteStoryTeller(service_url, tts_backend=tts_backend)
+    return BatikStoryTeller(tts_backend=tts_backend)
+
+def start_model_warmup(model_path=MODEL_PATH):
+    """Load and warm up the model in the background, once per server process.
+    
+    Returns the registry's readiness dict, or None when there is nothing to
+    load here (thin-client mode or no weights file).
+    """
+    if os.environ.get(INFERENCE_URL_ENV) or not os.path.exists(model_path):
+        return None
+    model_path, _ = resolve_weights(model_path)
+    return get_registry().preload(model_path)
+
+def session_storyteller(tts_backend=None):
+    """The storyteller for this browser session, rebuilt only when the voice engine changes"""
+    storyteller = st.session_state.get('storyteller')
+    if storyteller is None or storyteller.tts_backend.name != get_backend(tts_backend).name:
+        storyteller = create_storyteller(tts_backend=tts_backend)
+        st.session_state['storyteller'] = storyteller
+    return storyteller
+
+def upload_key(uploaded_file):
+    """Identifies an upload across reruns (same file, same key)"""
+    return getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+
+def render_tile_analysis(storyteller, tiles):
+    """Heatmap overlay plus the share of the fabric covered by each pattern"""
+    from tiling import PATTERN_COLOURS
+    
+    if tiles is None:
+        st.info("Tiled analysis needs the model (not available in demo mode).")
+        return
+    
+    rows, cols = tiles['grid'].shape[:2]
+    st.image(tiles['heatmap'], caption=f"Pattern heatmap ({rows}×{cols} tiles of {tiles['tile_size']}px)",
+             use_column_width=True)
+    # Shares are in class-ID order, which is also the heatmap colour order
+    for class_id, (class_name, share) in enumerate(tiles['area_share'].items()):
+        red, green, blue = PATTERN_COLOURS[class_id % len(PATTERN_COLOURS)]
+        story_name = storyteller.get_story(class_name)['name']
+        st.markdown(f'<span style="color: rgb({red}, {green}, {blue});">■</span> <b>{story_name}</b>: '
+                    f'{share * 100:.0f}% of the fabric', unsafe_allow_html=True)
+        st.progress(share)
+
+def render_similar(similar, columns=3):
+    """Thumbnails of the nearest pieces in the collection index"""
+    from similarity_index import get_similarity_index
+    
+    root = get_similarity_index().info.get('root', '')
+    st.markdown('<h4 class="section-header">🔎 Similar Pieces in Our Collection</h4>', unsafe_allow_html=True)
+    grid = st.columns(columns)
+    for i, item in enumerate(similar):
+        with grid[i % columns]:
+            path = os.path.join(root, item['id'])
+            caption = f"{os.path.basename(item['id'])} • {item['score'] * 100:.0f}% similar"
+            if os.path.exists(path):
+                st.image(path, caption=caption, use_column_width=True)
+            else:
+                st.caption(caption)
+
+def render_results_grid(storyteller, image_files, results, columns=3):
+    """Show a grid of thumbnails with the detected pattern for each image"""
+    st.markdown('<h2 class="sub-header">🗂️ Batch Results</h2>', unsafe_allow_html=True)
+    
+    grid = st.columns(columns)
+    for i, (image_file, result) in enumerate(zip(image_files, results)):
+        with grid[i % columns]:
+            if result:
+                st.image(result['thumbnail'], caption=image_file.name, use_column_width=True)
+                story_data = storyteller.get_story(result['primary_class'])
+                confidence_percent = result['confidence'] * 100
+                confidence_color = "confidence-high" if confidence_percent > 80 else "confidence-medium"
+                st.markdown(f'<b>{story_data["name"]}</b><br>'
+                            f'<span class="confidence-badge {confidence_color}">{confidence_percent:.1f}%</span>',
+                            unsafe_allow_html=True)
+            else:
+                st.caption(image_file.name)
+                st.error("Could not analyze")
+
+def stop_live_stream():
+    """Release this session's camera stream, if one is running"""
+    stream = st.session_state.pop('live_stream', None)
+    if stream is not None:
+        stream.stop()
+
+def render_live_camera(storyteller, source, smoother):
+    """Classify a camera/video feed, switching the story only when the label is stable"""
+    from stream_mode import DEFAULT_IDLE_TIMEOUT, StreamClassifier
+    
+    stream = st.session_state.get('live_stream')
+    
+    start_col, stop_col = st.columns(2)
+    if start_col.button("▶️ Start", use_container_width=True, disabled=stream is not None and stream.running):
+        if storyteller.model is None:
+            st.error("Live mode needs the model (not available in demo mode).")
+            return
+        try:
+            # Stops itself if this page stops polling it (tab closed, session gone)
+            stream = StreamClassifier(storyteller, source, smoother, idle_timeout=DEFAULT_IDLE_TIMEOUT).start()
+        except Exception as e:
+            st.error(f"Could not open the camera: {e}")
+            return
+        st.session_state['live_stream'] = stream
+    if stop_col.button("⏹️ Stop", use_container_width=True) and stream is not None:
+        stop_live_stream()
+        stream = None
+    
+    if stream is None:
+        st.info("Point the camera at a batik fabric and press Start.")
+        return
+    
+    frame_slot = st.empty()
+    story_slot = st.empty()
+    stats_slot = st.empty()
+    shown_label = None
+    # Runs until Stop (any widget interaction reruns the script and ends this loop)
+    while stream.running:
+        stream.keepalive()
+        if stream.last_frame is not None:
+            frame_slot.image(stream.last_frame, channels="BGR", use_column_width=True)
+        
+        stats = stream.stats()
+        if stats['label'] is not None and stats['label'] != shown_label:
+            shown_label = stats['label']
+            story_data = storyteller.get_story(shown_label)
+            story_slot.markdown(f'<div class="pattern-card"><h3 style="color: #2E7D32;">{story_data["name"]}</h3>'
+                                f'<p class="info-text">{story_data["story"]}</p></div>', unsafe_allow_html=True)
+        
+        latency = stats['latency_ms_p50']
+        latency_text = f"{latency:.0f} ms" if latency is not None else "–"
+        stats_slot.caption(f"🎥 {stats['fps']:.1f} FPS • latency {latency_text} • "
+                           f"{stats['frames_skipped']} frames skipped • confidence {stats['confidence'] * 100:.0f}%")
+        time.sleep(0.1)
+    
+    stop_live_stream()
+    if stream.last_error is not None:
+        st.error(f"Live classification stopped: {stream.last_error}")
+    else:
+        st.info("Stream ended.")
+
+def render_debug_panel(rerun_seconds=None):
+    """Sidebar breakdown of where the last request spent its time"""
+    with st.sidebar:
+        with st.expander("🐞 Debug: last request timings", expanded=False):
+            if rerun_seconds is not None:
+                st.caption(f"This rerun: {rerun_seconds * 1000:.1f} ms")
+            first_paint = st.session_state.get('first_paint_seconds')
+            first_prediction = st.session_state.get('first_prediction_seconds')
+            if first_paint is not None:
+                st.caption(f"Time to first paint: {first_paint * 1000:.0f} ms")
+            if first_prediction is not None:
+                st.caption(f"First prediction took: {first_prediction * 1000:.0f} ms")
+            last_card = st.session_state.get('last_card')
+            st.caption(f"CSS sent this rerun: {st.session_state.get('css_bytes', 0)} bytes")
+            if last_card is not None:
+                st.caption(f"Story card: {last_card['bytes']} bytes in one element, rendered in "
+                           f"{last_card['seconds'] * 1000:.2f} ms ({'cached' if last_card['cached'] else 'template'})")
+            request_trace = st.session_state.get('last_trace')
+            if request_trace is None or request_trace.total is None:
+                st.caption("No request recorded yet")
+            else:
+                st.table(request_trace.as_rows())
+                st.caption(f"Total {request_trace.total * 1000:.1f} ms ({request_trace.name})")
+            port = os.environ.get(metrics.METRICS_PORT_ENV)
+            if port:
+                st.caption(f"Prometheus metrics on :{port}/metrics")
 
 # Main App
 def main():
+    rerun_started = time.perf_counter()
+    setup_page()
+    metrics.start_metrics_server()
+    # Returns at once; the first click then finds a loaded, warmed-up model
+    warmup = start_model_warmup()
+    
     # Header
     st.markdown('<h1 class="main-header">🌸 Malaysian Batik Storyteller</h1>', unsafe_allow_html=True)
     st.markdown('<p class="info-text" style="text-align: center;">Discover the rich cultural heritage of Malaysian Batik patterns through AI-powered recognition and storytelling</p>', unsafe_allow_html=True)
@@ -368,6 +786,33 @@ def main():
         )
         st.markdown('</div>', unsafe_allow_html=True)
         
+        # Voice engine (gTTS needs internet, espeak runs offline)
+        tts_options = available_backends() or [get_backend().name]
+        default_tts = get_backend().name
+        selected_tts = st.selectbox(
+            "🔊 Voice Engine",
+            options=tts_options,
+            index=tts_options.index(default_tts) if default_tts in tts_options else 0
+        )
+        
+        # Tiled analysis for large scans mixing several motifs
+        tiled_mode = st.checkbox("🧩 Tiled analysis (large fabric scans)", value=False)
+        if tiled_mode:
+            from tiling import DEFAULT_STRIDE, DEFAULT_TILE_BATCH, DEFAULT_TILE_SIZE
+            tile_size = st.slider("Tile size (px)", 128, 1024, DEFAULT_TILE_SIZE, step=32)
+            tile_stride = st.slider("Stride (px)", 64, 1024, DEFAULT_STRIDE, step=32,
+                                    help="Smaller than the tile size means overlapping tiles")
+            tile_batch = st.slider("Tiles per batch", 1, 64, DEFAULT_TILE_BATCH)
+        
+        # Live camera for gallery installations
+        live_mode = st.checkbox("📷 Live camera", value=False)
+        if live_mode:
+            from stream_mode import DEFAULT_MIN_CONFIDENCE, DEFAULT_STABLE_UPDATES, DEFAULT_WINDOW
+            live_source = st.text_input("Camera index or video file", value="0")
+            live_window = st.slider("Smoothing window (frames)", 1, 30, DEFAULT_WINDOW)
+            live_stable = st.slider("Updates before the story switches", 1, 15, DEFAULT_STABLE_UPDATES)
+            live_confidence = st.slider("Minimum confidence", 0.0, 1.0, DEFAULT_MIN_CONFIDENCE, step=0.05)
+        
         # Information
         st.markdown('<h2 class="section-header">ℹ️ About</h2>', unsafe_allow_html=True)
         st.markdown('<p class="info-text">This AI-powered application detects and explains two traditional Malaysian batik patterns:</p>', unsafe_allow_html=True)
@@ -378,9 +823,53 @@ def main():
         with col2:
             st.markdown('<div style="text-align: center; padding: 0.5rem; background-color: #E8F5E9; border-radius: 8px;">🔶<br><b>Geometric</b><br>Islamic Art</div>', unsafe_allow_html=True)
         
+        # Model status
+        if warmup is not None:
+            if warmup['state'] == 'ready':
+                st.caption("🟢 Model ready")
+            elif warmup['state'] == 'loading':
+                st.caption("🟡 Model warming up… (the first analysis waits for it)")
+            else:
+                st.caption(f"🔴 Model failed to load: {warmup['error']}")
+        session = st.session_state.get('storyteller')
+        if session is not None and session.first_stage is not None:
+            cascade_stats = session.first_stage.stats()
+            if cascade_stats['answered']:
+                saved = cascade_stats['saved_seconds']
+                saved_text = f", ~{saved:.1f}s of model time saved" if saved is not None else ""
+                st.caption(f"🪜 Cascade: {cascade_stats['escalation_rate']:.0%} of "
+                           f"{cascade_stats['answered']} escalated to the full model{saved_text}")
+        pool_stats = get_inference_pool().stats()
+        st.caption(f"🧵 Inference: {pool_stats['running']}/{pool_stats['workers']} workers busy, "
+                   f"{pool_stats['waiting']} waiting")
+        cache_stats = get_prediction_cache().stats()
+        st.caption(f"⚡ Prediction cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                   f"({cache_stats['entries']} entries)")
+        model_stats = get_registry().stats()
+        for entry in model_stats['models']:
+            rss_delta = entry['rss_delta_bytes']
+            memory_text = f" • +{rss_delta / 2**20:.0f} MB" if rss_delta is not None else ""
+            st.caption(f"🧠 {os.path.basename(entry['path'])}: loaded in {entry['load_seconds']:.2f}s "
+                       f"(warm-up {entry['warmup_seconds']:.2f}s){memory_text}")
+        
         st.markdown("---")
         st.markdown('<p class="info-text" style="font-size: 0.9rem; color: #666;">Powered by YOLO AI model • UNESCO Cultural Heritage • Made with ❤️ for Malaysian Culture</p>', unsafe_allow_html=True)
     
+    # Header and sidebar are on screen: the session's first paint (includes imports on a cold process)
+    if 'first_paint_seconds' not in st.session_state:
+        st.session_state['first_paint_seconds'] = time.perf_counter() - SCRIPT_STARTED
+        metrics.observe("batik_first_paint_seconds", st.session_state['first_paint_seconds'])
+    
+    if live_mode:
+        st.markdown('<h2 class="sub-header">📷 Live Batik Recognition</h2>', unsafe_allow_html=True)
+        storyteller = session_storyteller(selected_tts)
+        storyteller.current_language = selected_lang
+        from stream_mode import LabelSmoother
+        render_live_camera(storyteller, live_source, LabelSmoother(live_window, live_stable, live_confidence))
+        return
+    # Live camera unticked: release the camera rather than leave it running unseen
+    stop_live_stream()
+    
     # Main content area
     col1, col2 = st.columns([1, 1])
     
@@ -388,109 +877,129 @@ def main():
         st.markdown('<h2 class="sub-header">📤 Upload Batik Image</h2>', unsafe_allow_html=True)
         
         # Upload section
-        uploaded_file = st.file_uploader(
+        uploaded_files = st.file_uploader(
             "Choose an image of batik fabric",
             type=['jpg', 'jpeg', 'png', 'bmp'],
-            help="Upload an image containing Bunga Raya or Geometric patterns"
+            help="Upload an image containing Bunga Raya or Geometric patterns, or a whole photo set",
+            accept_multiple_files=True
         )
+        uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
         
-        if uploaded_file is not None:
-            # Display uploaded image
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Uploaded Image", use_column_width=True)
+        if len(uploaded_files) > 1:
+            st.markdown(f'<p class="info-text">{len(uploaded_files)} images selected</p>', unsafe_allow_html=True)
+            batch_size = st.slider("Batch size", min_value=1, max_value=32, value=8,
+                                   help="How many images are sent to the model in one forward pass")
             
-            # Analyze button
-            if st.button("🔍 Analyze Pattern", type="primary", use_container_width=True):
-                with st.spinner("Analyzing pattern..."):
-                    # Initialize storyteller
-                    storyteller = BatikStoryTeller()
+            if st.button("🔍 Analyze All Patterns", type="primary", use_container_width=True):
+                with st.spinner(f"Analyzing {len(uploaded_files)} images..."):
+                    storyteller = session_storyteller(selected_tts)
                     storyteller.current_language = selected_lang
+                    results = storyteller.classify_many(uploaded_files, batch_size=batch_size)
+                
+                with col2:
+                    render_results_grid(storyteller, uploaded_files, results)
+        
+        elif uploaded_file is not None:
+            storyteller = session_storyteller(selected_tts)
+            storyteller.current_language = selected_lang
+            
+            # Decode once per upload: the thumbnail is displayed, the model-sized array is classified
+            key = upload_key(uploaded_file)
+            upload = st.session_state.get('upload')
+            if upload is None or upload['key'] != key or upload.get('model_size') != storyteller.model_size:
+                try:
+                    prepared = storyteller.prepare(uploaded_file)
+                except Exception as e:
+                    st.error(f"Could not read the image: {e}")
+                    return
+                upload = {'key': key, 'model_size': storyteller.model_size, 'prepared': prepared}
+                st.session_state['upload'] = upload
+            prepared = upload['prepared']
+            st.image(prepared.thumbnail, caption="Uploaded Image", use_column_width=True)
+            
+            # Analyze button: the only place inference runs; the outcome outlives reruns
+            request_trace = None
+            if st.button("🔍 Analyze Pattern", type="primary", use_container_width=True):
+                with st.spinner("Analyzing pattern..."), metrics.trace("analyze") as request_trace:
+                    if metrics.enabled():
+                        st.session_state['last_trace'] = request_trace
                     
-                    # Classify image
-                    result = storyteller.classify_image(uploaded_file)
+                    # Shown only while this request waits for a free model worker
+                    queue_slot = st.empty()
+                    storyteller.queue_listener = lambda position: queue_slot.info(
+                        f"⏳ All model workers are busy: you are #{position} in the queue"
+                    )
                     
-                    if result:
-                        # Get story
-                        story_data = storyteller.get_story(result['primary_class'])
+                    predict_started = time.perf_counter()
+                    result = storyteller.classify_image(prepared)
+                    if 'first_prediction_seconds' not in st.session_state:
+                        st.session_state['first_prediction_seconds'] = time.perf_counter() - predict_started
+                        metrics.observe("batik_first_prediction_seconds", st.session_state['first_prediction_seconds'])
+                    tiles = None
+                    if result and tiled_mode:
+                        tiles = storyteller.classify_tiles(uploaded_file, tile_size, tile_stride, tile_batch)
+                    similar = storyteller.find_similar(prepared) if result else []
+                    storyteller.queue_listener = None
+                    queue_slot.empty()
+                    st.session_state['analysis'] = {'key': key, 'result': result, 'tiles': tiles,
+                                                    'similar': similar}
+            
+            analysis = st.session_state.get('analysis')
+            if analysis is not None and analysis['key'] == key:
+                result = analysis['result']
+                if result and analysis['tiles'] is not None and tiled_mode:
+                    render_tile_analysis(storyteller, analysis['tiles'])
+                
+                if result:
+                    # Display results in col2
+                    with col2:
+                        st.markdown('<h2 class="sub-header">📖 Batik Story</h2>', unsafe_allow_html=True)
+                        # On the Analyze run, lookup and render still belong to that request's trace
+                        with metrics.resume(request_trace):
+                            # A language switch only costs a story lookup plus a (usually cached) card
+                            story_data = storyteller.get_story(result['primary_class'])
+                            with metrics.span("render"):
+                                render_started = time.perf_counter()
+                                card, card_cached = get_card_renderer().render(
+                                    result['primary_class'], selected_lang, result['confidence'], story_data
+                                )
+                                render_seconds = time.perf_counter() - render_started
+                                # The whole card is one element, sent in one delta
+                                st.markdown(card, unsafe_allow_html=True)
+                        st.session_state['last_card'] = {'bytes': len(card.encode("utf-8")),
+                                                         'seconds': render_seconds, 'cached': card_cached}
+                        metrics.observe("batik_card_render_seconds", render_seconds)
+                        metrics.observe("batik_payload_bytes", st.session_state['last_card']['bytes'],
+                                        buckets=PAYLOAD_BUCKETS, part="card")
                         
-                        # Display results in col2
-                        with col2:
-                            st.markdown('<h2 class="sub-header">📖 Batik Story</h2>', unsafe_allow_html=True)
-                            
-                            # Pattern card
-                            st.markdown('<div class="pattern-card">', unsafe_allow_html=True)
-                            
-                            # Pattern name and confidence
-                            st.markdown(f'<h3 style="color: #2E7D32; margin-bottom: 0.5rem;">{story_data["name"]}</h3>', unsafe_allow_html=True)
-                            
-                            confidence_percent = result['confidence'] * 100
-                            confidence_color = "confidence-high" if confidence_percent > 80 else "confidence-medium"
-                            st.markdown(f'<span class="confidence-badge {confidence_color}">Confidence: {confidence_percent:.1f}%</span>', unsafe_allow_html=True)
-                            
-                            # Pattern details
-                            st.markdown('<h4 class="section-header">📍 Origin</h4>', unsafe_allow_html=True)
-                            st.markdown(f'<p class="info-text">{story_data["origin"]}</p>', unsafe_allow_html=True)
-                            
-                            st.markdown('<h4 class="section-header">💫 Meaning</h4>', unsafe_allow_html=True)
-                            st.markdown(f'<p class="info-text">{story_data["meaning"]}</p>', unsafe_allow_html=True)
-                            
-                            st.markdown('<h4 class="section-header">🏛️ Cultural Significance</h4>', unsafe_allow_html=True)
-                            st.markdown(f'<p class="info-text">{story_data["cultural_significance"]}</p>', unsafe_allow_html=True)
-                            
-                            st.markdown('<h4 class="section-header">📚 Story</h4>', unsafe_allow_html=True)
-                            st.markdown(f'<p class="info-text">{story_data["story"]}</p>', unsafe_allow_html=True)
-                            
-                            # Special sections for BUNGA RAYA
-                            if 'bunga' in result['primary_class'].lower() or 'raya' in result['primary_class'].lower():
-                                if 'home_context' in story_data:
-                                    st.markdown('<h4 class="section-header">🏡 In Malaysian Homes</h4>', unsafe_allow_html=True)
-                                    st.markdown(f'<p class="info-text">{story_data["home_context"]}</p>', unsafe_allow_html=True)
-                                
-                                if 'artistic_expression' in story_data:
-                                    st.markdown('<h4 class="section-header">🎨 Artistic Expression</h4>', unsafe_allow_html=True)
-                                    st.markdown(f'<p class="info-text">{story_data["artistic_expression"]}</p>', unsafe_allow_html=True)
-                                
-                                if 'essence' in story_data:
-                                    st.markdown('<h4 class="section-header">💎 The Essence</h4>', unsafe_allow_html=True)
-                                    st.markdown(f'<p class="info-text">{story_data["essence"]}</p>', unsafe_allow_html=True)
-                            
-                            # Special sections for GEOMETRIC
-                            elif 'geometri' in result['primary_class'].lower():
-                                if 'islamic_influence' in story_data:
-                                    st.markdown('<h4 class="section-header">🕌 Islamic Influence</h4>', unsafe_allow_html=True)
-                                    st.markdown(f'<p class="info-text">{story_data["islamic_influence"]}</p>', unsafe_allow_html=True)
-                                
-                                if 'motifs_stories' in story_data:
-                                    st.markdown('<h4 class="section-header">🔶 Common Motifs & Stories</h4>', unsafe_allow_html=True)
-                                    st.markdown(f'<p class="info-text" style="white-space: pre-line;">{story_data["motifs_stories"]}</p>', unsafe_allow_html=True)
-                                
-                                if 'regional_heritage' in story_data:
-                                    st.markdown('<h4 class="section-header">🏝️ Regional Heritage</h4>', unsafe_allow_html=True)
-                                    st.markdown(f'<p class="info-text">{story_data["regional_heritage"]}</p>', unsafe_allow_html=True)
-                                
-                                if 'artistic_expression' in story_data:
-                                    st.markdown('<h4 class="section-header">🎨 Artistic Expression</h4>', unsafe_allow_html=True)
-                                    st.markdown(f'<p class="info-text">{story_data["artistic_expression"]}</p>', unsafe_allow_html=True)
-                                
-                                if 'essence' in story_data:
-                                    st.markdown('<h4 class="section-header">💎 The Essence</h4>', unsafe_allow_html=True)
-                                    st.markdown(f'<p class="info-text">{story_data["essence"]}</p>', unsafe_allow_html=True)
-                            
-                            st.markdown('</div>', unsafe_allow_html=True)
-                            
-                            # Audio section
-                            st.markdown('<h4 class="section-header">🔊 Listen to the Story</h4>', unsafe_allow_html=True)
-                            if st.button("🎵 Generate Audio Story", use_container_width=True):
-                                with st.spinner("Generating audio..."):
-                                    audio_bytes = storyteller.generate_audio(story_data)
-                                    if audio_bytes:
-                                        st.audio(audio_bytes, format='audio/mp3')
-                                        st.success("Audio generated successfully!")
-                                    else:
-                                        st.error("Could not generate audio")
-                    
-                    else:
-                        st.error("Could not analyze the image. Please try another image.")
+                        if analysis['similar']:
+                            render_similar(analysis['similar'])
+                        
+                        # Audio section
+                        st.markdown('<h4 class="section-header">🔊 Listen to the Story</h4>', unsafe_allow_html=True)
+                        if st.button("🎵 Generate Audio Story", use_container_width=True):
+                            with st.spinner("Generating audio..."), metrics.trace("audio") as audio_trace:
+                                if metrics.enabled():
+                                    st.session_state['last_trace'] = audio_trace
+                                # One player for the whole story; progress shows in its place meanwhile
+                                player = st.empty()
+                                try:
+                                    chunks = []
+                                    for audio_chunk in storyteller.stream_audio(story_data):
+                                        chunks.append(audio_chunk)
+                                        player.caption(f"🎙️ {len(chunks)} part(s) narrated...")
+                                    player.audio(storyteller.tts_backend.join(chunks),
+                                                 format=storyteller.tts_backend.mime_type)
+                                except Exception as e:
+                                    st.error(f"Could not generate audio: {e}")
+                                else:
+                                    timing = storyteller.last_audio_timing
+                                    st.success("Audio generated successfully!")
+                                    st.caption(f"First audio after {timing['time_to_first_audio']:.2f}s "
+                                               f"({timing['backend']}, {timing['chunks']} part(s))")
+                
+                else:
+                    st.error("Could not analyze the image. Please try another image.")
         
         else:
             # Show sample images when no file is uploaded
@@ -508,7 +1017,7 @@ def main():
             st.markdown('</div>', unsafe_allow_html=True)
     
     with col2:
-        if uploaded_file is None:
+        if not uploaded_files:
             st.markdown('<h2 class="sub-header">🎯 How to Use</h2>', unsafe_allow_html=True)
             st.markdown("""
             <div class="success-box">
@@ -537,6 +1046,14 @@ def main():
             </p>
             </div>
             """, unsafe_allow_html=True)
+    
+    # Whole-script time for this rerun (inference only runs on Analyze)
+    rerun_seconds = time.perf_counter() - rerun_started
+    metrics.observe("batik_rerun_seconds", rerun_seconds)
+    
+    # Debug panel (only when BATIK_METRICS=1)
+    if metrics.enabled():
+        render_debug_panel(rerun_seconds)
 
 if __name__ == "__main__":
     main()
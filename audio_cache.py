@@ -0,0 +1,181 @@
+# audio_cache.py
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import time
+
+from tts_backends import BACKENDS, get_backend, synthesize_chunked
+
+AUDIO_CACHE_ENV = "BATIK_AUDIO_CACHE"
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".audio_cache")
+DEFAULT_MAX_BYTES = 200 * 2**20
+
+
+def narration_text(story_data):
+    """The text we read aloud for a story"""
+    return f"{story_data['name']}. {story_data['story']}"
+
+
+class AudioCache:
+    """On-disk narration cache keyed by language and a hash of the text.
+
+    Files live at ``<directory>/<lang>/<sha256>.<extension>``. When the directory
+    grows past ``max_bytes`` the least recently used files are removed.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, extension="mp3"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, lang, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, lang, f"{digest}.{self.extension}")
+
+    def get(self, lang, text):
+        """Return cached audio bytes, or None on a miss"""
+        path = self.path_for(lang, text)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        # Touch so eviction sees this file as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, lang, text, data):
+        """Store audio bytes atomically and enforce the size cap"""
+        path = self.path_for(lang, text)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def get_or_render(self, lang, text, render):
+        data = self.get(lang, text)
+        if data is None:
+            data = render(text, lang)
+            self.put(lang, text, data)
+        return data
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith("." + self.extension):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def size_bytes(self):
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self):
+        """Remove least recently used files until we fit under the cap"""
+        with self._lock:
+            files = sorted(self._files(), key=lambda item: item[2])
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for path, size, _ in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            return removed
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size_bytes': self.size_bytes(),
+            'max_bytes': self.max_bytes,
+        }
+
+
+_caches = {}
+_cache_lock = threading.Lock()
+
+
+def cache_for_backend(backend, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+    """Audio from different backends lives in separate sub-directories"""
+    directory = directory or os.environ.get(AUDIO_CACHE_ENV, DEFAULT_CACHE_DIR)
+    return AudioCache(os.path.join(directory, backend.name), max_bytes, backend.extension)
+
+
+def get_audio_cache(backend):
+    """Return the audio cache for ``backend`` shared by every session"""
+    if backend.name not in _caches:
+        with _cache_lock:
+            if backend.name not in _caches:
+                _caches[backend.name] = cache_for_backend(backend)
+    return _caches[backend.name]
+
+
+def prerender(cache, store, languages, render, force=False):
+    """Render narration for every (pattern, language) pair ahead of time"""
+    rendered = skipped = 0
+    for pattern in store.patterns:
+        for lang in languages:
+            # Same lookup the app does, so fallbacks produce the same text
+            text = narration_text(store.story(pattern, lang))
+            if not force and os.path.exists(cache.path_for(lang, text)):
+                skipped += 1
+                continue
+            start = time.perf_counter()
+            cache.put(lang, text, render(text, lang))
+            rendered += 1
+            print(f"  ✓ {pattern} [{lang}] in {time.perf_counter() - start:.1f}s")
+    return rendered, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render narration audio for every batik story")
+    parser.add_argument("command", choices=["prerender", "stats", "clear"])
+    parser.add_argument("--cache-dir", default=os.environ.get(AUDIO_CACHE_ENV, DEFAULT_CACHE_DIR))
+    parser.add_argument("--max-mb", type=int, default=DEFAULT_MAX_BYTES // 2**20)
+    parser.add_argument("--backend", choices=list(BACKENDS), default=None,
+                        help="TTS backend (default: $BATIK_TTS_BACKEND or gtts)")
+    parser.add_argument("--force", action="store_true", help="Render again even if cached")
+    args = parser.parse_args(argv)
+
+    backend = get_backend(args.backend)
+    cache = cache_for_backend(backend, args.cache_dir, max_bytes=args.max_mb * 2**20)
+
+    if args.command == "prerender":
+        from story_store import get_story_store
+
+        store = get_story_store()
+        print(f"Pre-rendering narration into {cache.directory}")
+        render = lambda text, lang: synthesize_chunked(backend, text, lang)
+        rendered, skipped = prerender(cache, store, store.languages, render, force=args.force)
+        print(f"Done: {rendered} rendered, {skipped} already cached")
+    elif args.command == "stats":
+        print(cache.stats())
+    elif args.command == "clear":
+        cache.max_bytes = 0
+        print(f"Removed {cache.evict()} files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+# benchmark.py
+"""Reproducible benchmarks for the app's hot paths.
+
+    python benchmark.py                      # run, write benchmark_results.json
+    python benchmark.py --save-baseline      # also store the run as the baseline
+    python benchmark.py --baseline benchmark_baseline.json --tolerance 0.25
+
+Covers cold model load, warm classify_image at several input resolutions,
+get_story lookup and generate_audio through a local TTS stub. Every case
+reports p50/p95/p99 latency and peak RSS. When a baseline exists, any case
+whose p95 is more than ``tolerance`` slower fails the run.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+DEFAULT_MODEL = "best.pt"
+DEFAULT_OUTPUT = "benchmark_results.json"
+DEFAULT_BASELINE = "benchmark_baseline.json"
+SYNTHETIC_SIZES = (640, 2000, 4000, 6000)
+
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, math.ceil(q / 100.0 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak-RSS counter where supported (Linux >= 4.0)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+def summarize(name, samples_ms, peak_rss, **extra):
+    samples = sorted(samples_ms)
+    return dict({
+        'name': name,
+        'runs': len(samples),
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+        'mean_ms': sum(samples) / len(samples) if samples else None,
+        'peak_rss_bytes': peak_rss,
+    }, **extra)
+
+
+def run_case(name, func, repeats, warmup=1, **extra):
+    for _ in range(warmup):
+        func()
+    reset_peak_rss()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return summarize(name, samples, peak_rss_bytes(), **extra)
+
+
+class Upload(io.BytesIO):
+    """Stand-in for Streamlit's UploadedFile"""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def synthetic_jpeg(size, seed=0):
+    """A noisy, batik-ish test image of size x size*3/4 pixels"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    height = size * 3 // 4
+    ys, xs = np.mgrid[0:height, 0:size]
+    base = ((np.sin(xs / 23.0) + np.cos(ys / 17.0)) * 60 + 128).astype(np.uint8)
+    noise = rng.integers(0, 40, size=(height, size), dtype=np.uint8)
+    rgb = np.stack([base, base // 2 + noise, 255 - base], axis=-1)
+    buffer = io.BytesIO()
+    Image.fromarray(rgb).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def stub_tts_backend(delay_ms=5.0):
+    """A local TTS backend that returns a short silent WAV after a fixed delay"""
+    from tts_backends import EspeakBackend
+
+    class StubBackend(EspeakBackend):
+        name = "bench-stub"
+
+        def __init__(self):
+            super().__init__(executable="stub")
+
+        def synthesize(self, text, lang):
+            time.sleep(delay_ms / 1000.0)
+            buffer = io.BytesIO()
+            with wave.open(buffer, "wb") as out:
+                out.setnchannels(1)
+                out.setsampwidth(2)
+                out.setframerate(16000)
+                out.writeframes(b"\0\0" * 160 * max(1, len(text) // 10))
+            return buffer.getvalue()
+
+    return StubBackend()
+
+
+def cold_load_child(model_path):
+    """Runs in a fresh interpreter: time BatikStoryTeller() from nothing"""
+    start = time.perf_counter()
+    from Batik_Web_App_Test import BatikStoryTeller
+    imported = time.perf_counter()
+    storyteller = BatikStoryTeller(model_path=model_path)
+    done = time.perf_counter()
+    print(json.dumps({
+        'import_ms': (imported - start) * 1000.0,
+        'init_ms': (done - imported) * 1000.0,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'model_loaded': storyteller.model is not None,
+    }))
+
+
+def bench_cold_start(model_path, runs):
+    samples = []
+    import_ms = []
+    peaks = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--cold-load-child", "--model", model_path],
+            capture_output=True, text=True, check=True,
+        )
+        child = json.loads(completed.stdout.strip().splitlines()[-1])
+        samples.append(child['init_ms'])
+        import_ms.append(child['import_ms'])
+        peaks.append(child['peak_rss_bytes'] or 0)
+    return summarize("cold_model_load", samples, max(peaks),
+                     import_p50_ms=percentile(sorted(import_ms), 50),
+                     model_loaded=child['model_loaded'])
+
+
+def run_all(args):
+    """Every benchmark case, or None when the model cannot be loaded"""
+    from Batik_Web_App_Test import BatikStoryTeller
+    from story_store import get_story_store
+    from audio_cache import AudioCache, _caches
+    from prediction_cache import PredictionCache
+
+    storyteller = BatikStoryTeller(model_path=args.model)
+    if storyteller.model is None:
+        # Demo mode only decodes: its classify numbers would pass any baseline comparison
+        return None
+    # Every call must run the model, not the prediction cache
+    storyteller.prediction_cache = PredictionCache(max_entries=0)
+
+    results = [bench_cold_start(args.model, args.cold_runs)]
+
+    inputs = []
+    sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample images")
+    for filename in sorted(os.listdir(sample_dir)):
+        with open(os.path.join(sample_dir, filename), "rb") as f:
+            inputs.append((f"classify_sample_{os.path.splitext(filename)[0]}", f.read(), filename))
+    for size in SYNTHETIC_SIZES:
+        inputs.append((f"classify_synthetic_{size}px", synthetic_jpeg(size), f"synthetic_{size}.jpg"))
+
+    for name, data, filename in inputs:
+        results.append(run_case(
+            name, lambda: storyteller.classify_image(Upload(data, filename)), args.repeats,
+            input_bytes=len(data),
+        ))
+
+    # get_story is sub-microsecond, so time it in blocks of calls
+    classes = get_story_store().patterns + ["bunga raya", "Class_99"]
+    block = 1000
+
+    def story_block():
+        for i in range(block):
+            storyteller.get_story(classes[i % len(classes)], "ms")
+
+    case = run_case("get_story", story_block, args.repeats)
+    for key in ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'):
+        case[key] = case[key] / block
+    case['calls_per_run'] = block
+    results.append(case)
+
+    # Story cards: template render (cache off) vs the rendered-HTML cache, per card
+    from story_cards import StoryCardRenderer
+
+    cards = [(pattern, lang, get_story_store().story(pattern, lang))
+             for pattern in get_story_store().patterns for lang in get_story_store().languages]
+    payload = sum(len(StoryCardRenderer(0).render(p, lang, 0.93, story)[0].encode("utf-8"))
+                  for p, lang, story in cards) // len(cards)
+    for name, renderer in (("story_card_render", StoryCardRenderer(max_entries=0)),
+                           ("story_card_cached", StoryCardRenderer())):
+        case = run_case(name, lambda: [renderer.render(p, lang, 0.93, story) for p, lang, story in cards],
+                        args.repeats)
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'):
+            case[key] = case[key] / len(cards)
+        case['card_bytes'] = payload
+        results.append(case)
+
+    # Audio through a local stub so the network never enters the numbers
+    storyteller.tts_backend = stub_tts_backend()
+    story_data = storyteller.get_story("corak batik bunga raya", "en")
+    with tempfile.TemporaryDirectory() as audio_dir:
+        cache = AudioCache(audio_dir, max_bytes=0, extension=storyteller.tts_backend.extension)
+        _caches[storyteller.tts_backend.name] = cache
+        results.append(run_case("generate_audio_uncached", lambda: storyteller.generate_audio(story_data),
+                                args.repeats))
+        cache.max_bytes = 2**30
+        results.append(run_case("generate_audio_cached", lambda: storyteller.generate_audio(story_data),
+                                args.repeats))
+
+    return results
+
+
+def baseline_model_loaded(baseline):
+    """Whether a baseline was recorded with the real model (older reports only say so in cold_model_load)"""
+    if 'model_loaded' in baseline:
+        return baseline['model_loaded']
+    cold = [case for case in baseline.get('results', []) if case['name'] == 'cold_model_load']
+    return bool(cold and cold[0].get('model_loaded'))
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return the cases whose p95 regressed by more than ``tolerance``"""
+    previous = {case['name']: case for case in baseline.get('results', [])}
+    regressions = []
+    for case in results:
+        old = previous.get(case['name'])
+        if not old or not old.get('p95_ms') or case.get('p95_ms') is None:
+            continue
+        ratio = case['p95_ms'] / old['p95_ms']
+        case['baseline_p95_ms'] = old['p95_ms']
+        case['p95_ratio'] = ratio
+        if ratio > 1.0 + tolerance:
+            regressions.append(case)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark classify, story lookup, audio and cold start")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--cold-runs", type=int, default=3)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed p95 slowdown vs the baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--cold-load-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.cold_load_child:
+        cold_load_child(args.model)
+        return 0
+
+    results = run_all(args)
+    if results is None:
+        print(f"Could not load the model from {os.path.abspath(args.model)} "
+              f"(benchmarks need real predictions; pass --model)")
+        return 1
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'model': args.model,
+        'model_loaded': True,
+        'results': results,
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not baseline_model_loaded(baseline):
+            print(f"Baseline {args.baseline} was recorded in demo mode (no model); "
+                  f"record a new one with --save-baseline")
+            return 1
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+
+    print(f"{'case':34s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'peak RSS':>10s} {'vs base':>8s}")
+    for case in results:
+        rss = f"{case['peak_rss_bytes'] / 2**20:.0f} MB" if case.get('peak_rss_bytes') else "-"
+        ratio = f"{case['p95_ratio']:.2f}x" if 'p95_ratio' in case else "-"
+        print(f"{case['name']:34s} {case['p50_ms']:9.3f} {case['p95_ms']:9.3f} {case['p99_ms']:9.3f} "
+              f"{rss:>10s} {ratio:>8s}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"\n❌ PERFORMANCE REGRESSION: {len(regressions)} case(s) slower than baseline "
+              f"by more than {args.tolerance:.0%}")
+        for case in regressions:
+            print(f"   {case['name']}: p95 {case['baseline_p95_ms']:.3f} ms -> {case['p95_ms']:.3f} ms "
+                  f"({case['p95_ratio']:.2f}x)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
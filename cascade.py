@@ -0,0 +1,266 @@
+# cascade.py
+"""Confidence-gated cascade: a tiny first stage in front of best.pt.
+
+    python cascade.py train "Sample images" /archive/batik     # distil a head from the full model
+    python cascade.py evaluate "Sample images" --thresholds 0.8 0.9 0.95
+
+The first stage is hand-made colour and texture features (colour
+histograms, saturation, gradient-orientation histogram, edge density)
+followed by a softmax linear head. It costs a few milliseconds on the
+model-sized array we already decode. Bunga Raya prints are saturated with
+curved edges in every direction; geometric prints have a few dominant
+orientations. The head is trained on the full model's own answers, so no
+labelled data is needed and "agreement" is measured against exactly what
+it replaces.
+
+Enable it in the app with BATIK_CASCADE_THRESHOLD (e.g. 0.9). The head is
+read from BATIK_CASCADE_HEAD, defaulting to cascade_head.npz next to the
+weights. Below the threshold the full model runs as before.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+CASCADE_THRESHOLD_ENV = "BATIK_CASCADE_THRESHOLD"
+CASCADE_HEAD_ENV = "BATIK_CASCADE_HEAD"
+HEAD_FILENAME = "cascade_head.npz"
+DEFAULT_MODEL = "runs/classify/batik_75epochsv2/weights/best.pt"
+
+COLOUR_BINS = 8
+ORIENTATION_BINS = 12
+
+
+def head_path_for(model_path):
+    return os.environ.get(CASCADE_HEAD_ENV) or os.path.join(os.path.dirname(os.path.abspath(model_path)),
+                                                            HEAD_FILENAME)
+
+
+def configured_threshold():
+    """The cascade threshold from the environment, or None when the cascade is off"""
+    value = os.environ.get(CASCADE_THRESHOLD_ENV)
+    return float(value) if value else None
+
+
+def texture_features(bgr):
+    """Fixed-length colour/texture descriptor of a BGR uint8 array"""
+    # Half resolution is plenty for these statistics
+    image = bgr[::2, ::2].astype(np.float32) / 255.0
+
+    colour = [np.histogram(image[..., c], bins=COLOUR_BINS, range=(0.0, 1.0))[0] for c in range(3)]
+    colour = np.concatenate(colour).astype(np.float32) / (image.shape[0] * image.shape[1])
+    saturation = image.max(axis=-1) - image.min(axis=-1)
+
+    gray = image @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+    gx = gray[:-1, 1:] - gray[:-1, :-1]
+    gy = gray[1:, :-1] - gray[:-1, :-1]
+    magnitude = np.hypot(gx, gy)
+    angle = np.mod(np.arctan2(gy, gx), np.pi)
+    total = magnitude.sum() + 1e-6
+    orientation = np.histogram(angle, bins=ORIENTATION_BINS, range=(0.0, np.pi), weights=magnitude)[0] / total
+    entropy = -np.sum(orientation * np.log(orientation + 1e-9))
+
+    return np.concatenate([
+        colour,
+        image.reshape(-1, 3).mean(axis=0),
+        image.reshape(-1, 3).std(axis=0),
+        [saturation.mean(), saturation.std()],
+        orientation,
+        [orientation.max(), entropy, (magnitude > 0.1).mean(), magnitude.mean()],
+    ]).astype(np.float32)
+
+
+class FirstStage:
+    """Softmax linear head over ``texture_features``, plus running cascade statistics"""
+
+    def __init__(self, weights, bias, mean, std, class_ids):
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.std = std
+        self.class_ids = [int(c) for c in class_ids]
+        self._lock = threading.Lock()
+        self.answered = 0
+        self.escalated = 0
+        self.fast_seconds = 0.0
+        self.full_seconds = 0.0
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['weights'], data['bias'], data['mean'], data['std'], data['class_ids'])
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                 class_ids=np.array(self.class_ids))
+
+    @classmethod
+    def fit(cls, features, labels, epochs=500, learning_rate=0.5, l2=1e-3):
+        """Multinomial logistic regression by full-batch gradient descent"""
+        features = np.asarray(features, dtype=np.float32)
+        class_ids = sorted(set(int(label) for label in labels))
+        targets = np.zeros((len(labels), len(class_ids)), dtype=np.float32)
+        targets[np.arange(len(labels)), [class_ids.index(int(label)) for label in labels]] = 1.0
+
+        mean = features.mean(axis=0)
+        std = features.std(axis=0) + 1e-6
+        x = (features - mean) / std
+        weights = np.zeros((x.shape[1], len(class_ids)), dtype=np.float32)
+        bias = np.zeros(len(class_ids), dtype=np.float32)
+        for _ in range(epochs):
+            probs = _softmax(x @ weights + bias)
+            error = (probs - targets) / len(x)
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return cls(weights, bias, mean, std, class_ids)
+
+    def predict_proba(self, bgr):
+        """(class_id, confidence) of the most likely class"""
+        probs = _softmax(((texture_features(bgr) - self.mean) / self.std) @ self.weights + self.bias)
+        best = int(probs.argmax())
+        return self.class_ids[best], float(probs[best])
+
+    def record(self, escalated, fast_seconds, full_seconds=0.0):
+        with self._lock:
+            self.answered += 1
+            self.escalated += int(escalated)
+            self.fast_seconds += fast_seconds
+            self.full_seconds += full_seconds
+
+    def stats(self):
+        """Escalation rate and the estimated full-model time the cascade saved"""
+        with self._lock:
+            answered, escalated = self.answered, self.escalated
+            fast_seconds, full_seconds = self.fast_seconds, self.full_seconds
+        mean_full = full_seconds / escalated if escalated else None
+        saved = None
+        if mean_full is not None:
+            # Every fast answer skipped one full pass; every request paid for the first stage
+            saved = (answered - escalated) * mean_full - fast_seconds
+        return {
+            'answered': answered,
+            'escalated': escalated,
+            'escalation_rate': escalated / answered if answered else None,
+            'saved_seconds': saved,
+        }
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+_stages = {}
+_stages_lock = threading.Lock()
+
+
+def get_first_stage(path):
+    """The first-stage head at ``path`` (shared per process), or None if it does not exist"""
+    if not os.path.exists(path):
+        return None
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    stage = _stages.get(key)
+    if stage is None:
+        with _stages_lock:
+            stage = _stages.get(key)
+            if stage is None:
+                stage = _stages[key] = FirstStage.load(path)
+    return stage
+
+
+def _load_samples(directories, model):
+    """Model-sized arrays for every image in ``directories`` with the full model's answers and timings"""
+    from catalogue import find_images
+    from image_pipeline import model_input_size, prepare_image
+
+    model_size = model_input_size(model)
+    arrays, labels, full_seconds = [], [], []
+    for directory in directories:
+        for path in find_images(directory):
+            try:
+                prepared = prepare_image(os.path.join(directory, path), model_size=model_size)
+            except Exception as e:
+                print(f"skipping {path}: {e}")
+                continue
+            start = time.perf_counter()
+            result = model.predict(prepared.model_array, verbose=False)[0]
+            full_seconds.append(time.perf_counter() - start)
+            arrays.append(prepared.model_array)
+            labels.append(int(result.probs.top1))
+    return arrays, labels, full_seconds
+
+
+def evaluate(stage, arrays, labels, full_seconds, thresholds):
+    """Escalation rate, agreement with the full model and latency saved, per threshold"""
+    answers = []
+    for array in arrays:
+        start = time.perf_counter()
+        class_id, confidence = stage.predict_proba(array)
+        answers.append((class_id, confidence, time.perf_counter() - start))
+
+    full_total = sum(full_seconds)
+    rows = []
+    for threshold in thresholds:
+        agree = escalated = 0
+        cascade_total = 0.0
+        for (class_id, confidence, fast), label, full in zip(answers, labels, full_seconds):
+            cascade_total += fast
+            if confidence >= threshold:
+                agree += int(class_id == label)
+            else:
+                escalated += 1
+                agree += 1
+                cascade_total += full
+        rows.append({
+            'threshold': threshold,
+            'escalation_rate': escalated / len(labels),
+            'agreement': agree / len(labels),
+            'latency_saved': 1.0 - cascade_total / full_total if full_total else None,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and evaluate the cascade's first-stage classifier")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("directories", nargs="+", help="Image folders (labelled by the full model)")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--head", default=None, help=f"Head file (default: {HEAD_FILENAME} next to the weights)")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.8, 0.9, 0.95, 0.99])
+    args = parser.parse_args(argv)
+
+    from model_registry import get_registry
+
+    head = args.head or head_path_for(args.model)
+    model = get_registry().get(args.model)
+    arrays, labels, full_seconds = _load_samples(args.directories, model)
+    if not arrays:
+        print("No images found")
+        return 1
+
+    if args.command == "train":
+        if len(set(labels)) < 2:
+            print("The full model gave every image the same class; add more varied images")
+            return 1
+        stage = FirstStage.fit([texture_features(array) for array in arrays], labels)
+        stage.save(head)
+        print(f"Trained on {len(arrays)} images → {head}")
+    else:
+        stage = FirstStage.load(head)
+
+    print(f"{len(arrays)} images, full model {np.median(full_seconds) * 1000:.1f} ms median")
+    print(f"{'threshold':>9s} {'escalated':>10s} {'agreement':>10s} {'latency saved':>14s}")
+    for row in evaluate(stage, arrays, labels, full_seconds, args.thresholds):
+        saved = f"{row['latency_saved']:.0%}" if row['latency_saved'] is not None else "-"
+        print(f"{row['threshold']:9.2f} {row['escalation_rate']:10.0%} {row['agreement']:10.0%} {saved:>14s}")
+    if args.command == "train":
+        print("Note: scores on the training images are optimistic; evaluate on a held-out folder too")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# catalogue.py
+"""Offline bulk cataloguing of a batik photo archive.
+
+    python catalogue.py /archive/batik --output catalogue.jsonl --lang en ms
+    python catalogue.py /archive/batik --output catalogue.parquet --workers 8 --batch-size 32
+
+Images are found by walking the directory, split into chunks and
+classified across a pool of processes, each holding its own
+BatikStoryTeller and running real batches through the model. Every record
+carries the stories for the chosen languages.
+
+Progress is committed chunk by chunk: a JSONL line is only counted once
+its newline is on disk, and each Parquet part is written to a temporary
+name and renamed. Re-running the same command therefore skips everything
+already in the output and carries on where an interrupted run stopped.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+DEFAULT_MODEL = "runs/classify/batik_75epochsv2/weights/best.pt"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_CHUNK_SIZE = 256
+
+
+def find_images(root):
+    """Every image below ``root``, as sorted paths relative to it"""
+    found = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(found)
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# One storyteller per worker process, built by the pool initializer
+_worker = None
+
+
+def _init_worker(model_path, backend, languages, batch_size, torch_threads):
+    global _worker
+    # Each process runs one batch at a time on its own share of the cores
+    os.environ["BATIK_INFERENCE_WORKERS"] = "1"
+    os.environ["BATIK_TORCH_THREADS"] = str(torch_threads)
+
+    from Batik_Web_App_Test import BatikStoryTeller
+
+    storyteller = BatikStoryTeller(model_path=model_path, backend=backend)
+    # Raised from the first task instead: a failing initializer makes Pool respawn workers forever
+    _worker = (storyteller, languages, batch_size)
+
+
+def _catalogue_chunk(args):
+    root, paths = args
+    storyteller, languages, batch_size = _worker
+    if storyteller.model is None:
+        raise RuntimeError(f"Could not load the model from {storyteller.model_path}")
+    results = storyteller.classify_many([os.path.join(root, path) for path in paths], batch_size=batch_size)
+
+    records = []
+    for path, result in zip(paths, results):
+        record = {'path': path}
+        if result is None:
+            record['error'] = "could not be decoded or classified"
+        else:
+            record.update({
+                'primary_class': result['primary_class'],
+                'class_id': int(result['class_id']),
+                'confidence': float(result['confidence']),
+                'stories': {lang: storyteller.get_story(result['primary_class'], lang) for lang in languages},
+            })
+        records.append(record)
+    return records
+
+
+class JsonlWriter:
+    """Appends records to a JSONL file; complete lines already there count as done"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def done(self):
+        if not os.path.exists(self.path):
+            return set()
+        done = set()
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            # Drop a half-written last line left by an interrupted run
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            done.add(json.loads(line)['path'])
+        return done
+
+    def write(self, records):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ParquetWriter:
+    """Writes each chunk as ``<output>/part-NNNNNN.parquet`` (needs pyarrow)"""
+
+    def __init__(self, path):
+        import pyarrow  # noqa: F401 - fail before any work is done
+
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.parts = len(glob.glob(os.path.join(path, "part-*.parquet")))
+
+    def done(self):
+        import pyarrow.parquet as pq
+
+        done = set()
+        for part in glob.glob(os.path.join(self.path, "part-*.parquet")):
+            done.update(pq.read_table(part, columns=['path']).column('path').to_pylist())
+        return done
+
+    def write(self, records):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Stories are nested dicts whose fields differ by pattern; keep them as JSON text
+        rows = [{
+            'path': record['path'],
+            'primary_class': record.get('primary_class'),
+            'class_id': record.get('class_id'),
+            'confidence': record.get('confidence'),
+            'stories': json.dumps(record['stories'], ensure_ascii=False) if 'stories' in record else None,
+            'error': record.get('error'),
+        } for record in records]
+        target = os.path.join(self.path, f"part-{self.parts:06d}.parquet")
+        pq.write_table(pa.Table.from_pylist(rows), target + ".tmp")
+        os.replace(target + ".tmp", target)
+        self.parts += 1
+
+
+def open_writer(output, output_format=None):
+    output_format = output_format or ('parquet' if output.endswith('.parquet') else 'jsonl')
+    return ParquetWriter(output) if output_format == 'parquet' else JsonlWriter(output)
+
+
+def run(root, output, languages, workers, batch_size, chunk_size, model_path, backend=None, output_format=None):
+    """Catalogue every image under ``root`` that is not in ``output`` yet; returns a summary"""
+    writer = open_writer(output, output_format)
+    paths = find_images(root)
+    done = writer.done()
+    todo = [path for path in paths if path not in done]
+    print(f"{len(paths)} images found, {len(done)} already catalogued, {len(todo)} to go")
+    if not todo:
+        return {'images': 0, 'seconds': 0.0, 'images_per_second': 0.0, 'errors': 0}
+
+    workers = max(1, min(workers, -(-len(todo) // chunk_size)))
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    start = time.perf_counter()
+    finished = errors = 0
+
+    # spawn: a fork of a process that has already touched torch threads can deadlock
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=_init_worker,
+                      initargs=(model_path, backend, languages, batch_size, torch_threads)) as pool:
+        chunks = ((root, chunk) for chunk in chunked(todo, chunk_size))
+        for records in pool.imap_unordered(_catalogue_chunk, chunks):
+            writer.write(records)
+            finished += len(records)
+            errors += sum(1 for record in records if 'error' in record)
+            elapsed = time.perf_counter() - start
+            rate = finished / elapsed if elapsed > 0 else 0.0
+            eta = (len(todo) - finished) / rate if rate > 0 else float('inf')
+            print(f"\r{finished}/{len(todo)} images | {rate:.1f} img/s | ETA {eta:.0f}s | {errors} errors",
+                  end="", flush=True)
+    print()
+
+    seconds = time.perf_counter() - start
+    return {
+        'images': finished,
+        'seconds': seconds,
+        'images_per_second': finished / seconds if seconds > 0 else 0.0,
+        'errors': errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify and narrate a whole directory of batik photos")
+    parser.add_argument("root", help="Directory to walk for images")
+    parser.add_argument("--output", default="catalogue.jsonl", help="JSONL file, or a .parquet directory")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default=None,
+                        help="Output format (default: from the output name)")
+    parser.add_argument("--lang", nargs="+", default=["en"], help="Story languages to attach")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Images per work unit; progress is committed after each")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--backend", choices=["torch", "onnxruntime", "openvino"],
+                        help="Inference runtime (default: $BATIK_MODEL_BACKEND or torch)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        print(f"Not a directory: {args.root}")
+        return 1
+    if not os.path.exists(args.model):
+        print(f"Model not found: {args.model} (cataloguing needs real predictions)")
+        return 1
+
+    summary = run(args.root, args.output, args.lang, args.workers, args.batch_size, args.chunk_size,
+                  args.model, args.backend, args.format)
+    print(f"Catalogued {summary['images']} images in {summary['seconds']:.1f}s "
+          f"({summary['images_per_second']:.1f} img/s, {summary['errors']} errors) → {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
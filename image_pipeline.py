@@ -0,0 +1,163 @@
+# image_pipeline.py
+import hashlib
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# YOLO classifiers are trained at 224px unless the checkpoint says otherwise
+DEFAULT_MODEL_SIZE = 224
+DEFAULT_THUMBNAIL_SIZE = 640
+
+# Anything bigger than this (after draft-mode reduction) is refused instead
+# of decoded, so a single upload cannot blow up the worker's memory
+MAX_DECODED_PIXELS = 64_000_000
+
+# Longest side a fabric scan is decoded to for tiled analysis
+DEFAULT_SCAN_SIDE = 4096
+
+
+class PreparedImage:
+    """An upload decoded once into a model-sized array and a UI thumbnail"""
+
+    def __init__(self, name, model_array, thumbnail, original_size, content_hash=None):
+        self.name = name
+        self.content_hash = content_hash
+        self.model_array = model_array
+        self.thumbnail = thumbnail
+        self.original_size = original_size
+
+
+def model_input_size(model, default=DEFAULT_MODEL_SIZE):
+    """Read the classifier input size from a loaded YOLO model"""
+    overrides = getattr(model, 'overrides', None) or {}
+    imgsz = overrides.get('imgsz', default)
+    if isinstance(imgsz, (list, tuple)):
+        imgsz = max(imgsz)
+    return int(imgsz or default)
+
+
+def _read_source(image_file):
+    """Return the raw bytes of an upload, path, or file-like object"""
+    if isinstance(image_file, (bytes, bytearray)):
+        return bytes(image_file)
+    if isinstance(image_file, str):
+        with open(image_file, 'rb') as f:
+            return f.read()
+    if hasattr(image_file, 'getvalue'):
+        return image_file.getvalue()
+    image_file.seek(0)
+    return image_file.read()
+
+
+def _to_rgb(image):
+    """Flatten alpha/palette images onto white and return an RGB image"""
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    if image.mode in ('RGBA', 'LA', 'PA'):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def _shortest_side_resize(image, size):
+    """Scale so the shorter side equals ``size`` (never upscaling)"""
+    width, height = image.size
+    shortest = min(width, height)
+    if shortest <= size:
+        return image
+    scale = size / shortest
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return image.resize(new_size, Image.BILINEAR)
+
+
+def _fit_within(image, size):
+    """A new image scaled to fit in ``size`` x ``size`` (never upscaling).
+
+    Unlike ``copy()`` + ``thumbnail()`` this only allocates the small
+    output (plus a ``reduce`` step at most half the input size).
+    """
+    width, height = image.size
+    scale = min(size / width, size / height)
+    if scale >= 1:
+        return image.copy()
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return image.resize(new_size, Image.BILINEAR, reducing_gap=2.0)
+
+
+def prepare_image(image_file, model_size=DEFAULT_MODEL_SIZE, thumbnail_size=DEFAULT_THUMBNAIL_SIZE):
+    """Decode an upload once, at reduced resolution where the format allows.
+
+    JPEGs are decoded with PIL ``draft`` so the DCT scaler does most of the
+    downsizing and the full-resolution bitmap is never materialised. The
+    result holds a contiguous BGR uint8 array whose shorter side matches the
+    model input (the layout ultralytics expects for numpy input) and a
+    separate RGB thumbnail for display.
+    """
+    data = _read_source(image_file)
+    content_hash = hashlib.sha256(data).hexdigest()
+    name = getattr(image_file, 'name', image_file if isinstance(image_file, str) else 'image')
+
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+
+    # Ask the JPEG decoder for the smallest scale still covering both outputs
+    target = max(model_size, thumbnail_size)
+    if image.format == 'JPEG':
+        image.draft('RGB', (target, target))
+
+    if image.size[0] * image.size[1] > MAX_DECODED_PIXELS:
+        raise ValueError(
+            f"Image is too large to process ({original_size[0]}x{original_size[1]})"
+        )
+
+    image = ImageOps.exif_transpose(image)
+    image = _to_rgb(image)
+
+    thumbnail = _fit_within(image, thumbnail_size)
+
+    # Derive the model input from the (already small) thumbnail when possible
+    source = thumbnail if min(thumbnail.size) >= model_size else image
+    model_image = _shortest_side_resize(source, model_size)
+    model_array = np.ascontiguousarray(np.asarray(model_image)[:, :, ::-1])
+
+    image.close()
+    return PreparedImage(name, model_array, thumbnail, original_size, content_hash)
+
+
+def decode_scan(image_file, max_side=DEFAULT_SCAN_SIDE, thumbnail_size=DEFAULT_THUMBNAIL_SIZE):
+    """Decode a large scan for tiling: (BGR array, RGB thumbnail, scale).
+
+    The scan is decoded (with JPEG draft where possible) to at most
+    ``max_side`` pixels on its longest side, so tiled analysis of a
+    100 MP sarong costs the same memory as a 16 MP one. ``scale`` maps
+    array pixels back to original pixels.
+    """
+    data = _read_source(image_file)
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+
+    longest = max(original_size)
+    if image.format == 'JPEG' and longest > max_side:
+        ratio = max_side / longest
+        image.draft('RGB', (int(original_size[0] * ratio), int(original_size[1] * ratio)))
+
+    if image.size[0] * image.size[1] > MAX_DECODED_PIXELS:
+        raise ValueError(
+            f"Image is too large to process ({original_size[0]}x{original_size[1]})"
+        )
+
+    image = ImageOps.exif_transpose(image)
+    image = _to_rgb(image)
+    image.thumbnail((max_side, max_side), Image.BILINEAR)
+
+    thumbnail = _fit_within(image, thumbnail_size)
+
+    scan = np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+    scale = max(original_size) / max(image.size)
+    image.close()
+    return scan, thumbnail, scale
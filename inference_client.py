@@ -0,0 +1,54 @@
+# inference_client.py
+import io
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+
+INFERENCE_URL_ENV = "BATIK_INFERENCE_URL"
+
+
+class InferenceServiceError(RuntimeError):
+    pass
+
+
+class InferenceClient:
+    """Small HTTP client for inference_service.py (stdlib only)"""
+
+    def __init__(self, base_url, timeout=30.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, data=None, headers=None):
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers or {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode("utf-8", "replace")
+            raise InferenceServiceError(f"{e.code} from inference service: {detail}") from e
+        except urllib.error.URLError as e:
+            raise InferenceServiceError(f"Inference service unreachable: {e.reason}") from e
+
+    def classify_array(self, model_array, name="image", language=None):
+        """Send an already prepared model-sized array (the service skips decoding)"""
+        import numpy as np
+
+        buffer = io.BytesIO()
+        np.save(buffer, model_array, allow_pickle=False)
+        headers = {"Content-Type": "application/x-npy", "X-Filename": urllib.parse.quote(name)}
+        query = f"?lang={urllib.parse.quote(language)}" if language else ""
+        return self._request(f"/classify{query}", buffer.getvalue(), headers)
+
+    def classify_bytes(self, image_bytes, name="image", language=None):
+        """Send an encoded image (JPEG/PNG/...) for the service to decode"""
+        headers = {"Content-Type": "application/octet-stream", "X-Filename": urllib.parse.quote(name)}
+        query = f"?lang={urllib.parse.quote(language)}" if language else ""
+        return self._request(f"/classify{query}", image_bytes, headers)
+
+    def story(self, batik_class, language):
+        query = urllib.parse.urlencode({"class": batik_class, "lang": language})
+        return self._request(f"/story?{query}")
+
+    def health(self):
+        return self._request("/health")
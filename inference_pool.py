@@ -0,0 +1,175 @@
+# inference_pool.py
+"""Shared, bounded pool for model inference across Streamlit sessions.
+
+    BATIK_INFERENCE_WORKERS   predictions allowed to run at once (default 1)
+    BATIK_TORCH_THREADS       PyTorch intra-op threads (default: cores / workers)
+    BATIK_MAX_QUEUE           requests allowed to wait for a worker (default 32)
+    BATIK_QUEUE_TIMEOUT       seconds a request may wait before giving up (default 30)
+
+Without it every session calls ``model.predict`` directly, so a burst of
+visitors runs that many predictions at once, each with a full-size torch
+thread pool, and all of them slow down. Here at most ``workers``
+predictions run at a time and the rest wait in FIFO order; once
+``max_queue`` requests are waiting, new ones are turned away at once.
+
+Calls on one registry model are serialised anyway (the ultralytics
+predictor is not thread-safe, see ``model_registry.SharedModel``), so one
+worker with every core for torch is the default. More workers only help
+when several models or exported backends are served from one process.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+WORKERS_ENV = "BATIK_INFERENCE_WORKERS"
+TORCH_THREADS_ENV = "BATIK_TORCH_THREADS"
+MAX_QUEUE_ENV = "BATIK_MAX_QUEUE"
+QUEUE_TIMEOUT_ENV = "BATIK_QUEUE_TIMEOUT"
+
+DEFAULT_WORKERS = 1
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_QUEUE_TIMEOUT = 30.0
+
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class InferenceBusy(RuntimeError):
+    """The queue is full, or the request waited longer than the timeout"""
+
+
+def _limit_torch_threads(threads):
+    # set_num_threads is process-wide; only touch torch if the model already loaded it
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+class _Ticket:
+    __slots__ = ('submitted', 'started', 'finished', 'cancelled', 'admitted')
+
+    def __init__(self):
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+        self.cancelled = False
+        self.admitted = threading.Event()
+
+
+class InferencePool:
+    """Runs model calls on a fixed number of workers behind a bounded FIFO queue"""
+
+    def __init__(self, workers=None, torch_threads=None, max_queue=None, queue_timeout=None):
+        cores = os.cpu_count() or 1
+        self.workers = max(1, int(workers or os.environ.get(WORKERS_ENV) or DEFAULT_WORKERS))
+        self.torch_threads = max(1, int(torch_threads or os.environ.get(TORCH_THREADS_ENV)
+                                        or cores // self.workers or 1))
+        self.max_queue = int(max_queue if max_queue is not None
+                             else os.environ.get(MAX_QUEUE_ENV, DEFAULT_MAX_QUEUE))
+        self.queue_timeout = float(queue_timeout if queue_timeout is not None
+                                   else os.environ.get(QUEUE_TIMEOUT_ENV, DEFAULT_QUEUE_TIMEOUT))
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="inference",
+            initializer=_limit_torch_threads, initargs=(self.torch_threads,)
+        )
+        self._lock = threading.Lock()
+        self._waiting = collections.deque()
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def run(self, fn, *args, stage="predict", on_wait=None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on a worker and return its result.
+
+        Blocks the caller until the call finishes. While the request is
+        queued, ``on_wait(position)`` is called whenever its 1-based queue
+        position changes. Queue wait and compute time are recorded as the
+        ``queue_wait`` and ``stage`` spans. Raises InferenceBusy when the
+        queue is full or the wait exceeds ``queue_timeout``.
+        """
+        ticket = _Ticket()
+        with self._lock:
+            waiting = len(self._waiting)
+            if waiting >= self.max_queue:
+                self.rejected += 1
+                metrics.inc("batik_queue_rejected_total")
+                raise InferenceBusy(f"{waiting} requests are already waiting")
+            self._waiting.append(ticket)
+            future = self._executor.submit(self._work, ticket, fn, args, kwargs)
+        metrics.observe("batik_queue_depth", waiting, buckets=QUEUE_DEPTH_BUCKETS)
+
+        deadline = ticket.submitted + self.queue_timeout
+        last_position = None
+        while not ticket.admitted.wait(0.1):
+            with self._lock:
+                if ticket.started is None and time.perf_counter() > deadline:
+                    # The worker skips cancelled tickets when it reaches them
+                    ticket.cancelled = True
+                    self._waiting.remove(ticket)
+                    self.timed_out += 1
+                    metrics.inc("batik_queue_timeouts_total")
+                    raise InferenceBusy(f"no worker became free within {self.queue_timeout:g}s")
+                position = self._position(ticket)
+            if on_wait is not None and position and position != last_position:
+                on_wait(position)
+                last_position = position
+
+        result = future.result()
+        metrics.record("queue_wait", ticket.started - ticket.submitted)
+        metrics.record(stage, ticket.finished - ticket.started)
+        return result
+
+    def _work(self, ticket, fn, args, kwargs):
+        with self._lock:
+            if ticket.cancelled:
+                return None
+            self._waiting.remove(ticket)
+            self._running += 1
+            ticket.started = time.perf_counter()
+        ticket.admitted.set()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            ticket.finished = time.perf_counter()
+            with self._lock:
+                self._running -= 1
+                self.completed += 1
+
+    def _position(self, ticket):
+        try:
+            return self._waiting.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'torch_threads': self.torch_threads,
+                'running': self._running,
+                'waiting': len(self._waiting),
+                'max_queue': self.max_queue,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_pool():
+    """Return the inference pool shared by every session in this process"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool()
+    return _pool
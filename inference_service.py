@@ -0,0 +1,296 @@
+# inference_service.py
+"""Headless classification and story service with dynamic micro-batching.
+
+Run it next to (or away from) the Streamlit app:
+
+    python inference_service.py --model best.pt --port 8502
+
+and point the app at it with BATIK_INFERENCE_URL=http://localhost:8502.
+
+Endpoints:
+    POST /classify[?lang=xx]   body: encoded image, or a .npy model array
+    GET  /story?class=...&lang=xx
+    GET  /health
+    GET  /metrics              Prometheus text (with BATIK_METRICS=1)
+"""
+import argparse
+import hashlib
+import io
+import json
+import queue
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import metrics
+from image_pipeline import PreparedImage
+from model_registry import current_rss_bytes
+
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_WAIT_MS = 10
+# Request bodies above this are refused before they are read
+DEFAULT_MAX_BODY_BYTES = 50 * 2**20
+# Longest side accepted for a prepared .npy model array
+MAX_ARRAY_SIDE = 4096
+
+
+class MicroBatcher:
+    """Groups concurrent classification requests into model batches.
+
+    A single worker thread takes the first waiting request, then keeps
+    collecting until ``max_batch_size`` requests are in hand or
+    ``max_wait_ms`` has passed, and runs them in one forward pass.
+    """
+
+    def __init__(self, storyteller, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.storyteller = storyteller
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, prepared):
+        """Queue a PreparedImage; returns a Future with the result dict"""
+        future = Future()
+        self._queue.put((prepared, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self._classify(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    # One bad item must not fail the requests it happened to be batched with
+                    self._classify_one_by_one(batch)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+
+    def _classify_one_by_one(self, batch):
+        metrics.inc("batik_batch_retries_total")
+        for item in batch:
+            try:
+                result = self._classify([item])[0]
+            except Exception as e:
+                item[1].set_exception(e)
+            else:
+                item[1].set_result(result)
+            self.batches += 1
+            self.items += 1
+
+    def _classify(self, batch):
+        storyteller = self.storyteller
+        prepared_images = [prepared for prepared, _ in batch]
+        if storyteller.model is None:
+            return [storyteller.classify_image(prepared) for prepared in prepared_images]
+
+        with metrics.span("predict_batch"):
+            predictions = storyteller.model.predict([p.model_array for p in prepared_images], verbose=False)
+        metrics.observe("batik_batch_size", len(prepared_images), buckets=(1, 2, 4, 8, 16, 32, 64))
+        return [
+            storyteller._store_result(storyteller._build_result(prediction, prepared), prepared)
+            for prediction, prepared in zip(predictions, prepared_images)
+        ]
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+        }
+
+
+def result_to_json(result):
+    """Strip arrays/thumbnails so the result can be sent as JSON"""
+    return {
+        'primary_class': result['primary_class'],
+        'confidence': float(result['confidence']),
+        'class_id': int(result['class_id']),
+        'cached': bool(result.get('cached', False)),
+    }
+
+
+class InferenceService:
+    def __init__(self, storyteller, batcher, max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+        self.storyteller = storyteller
+        self.batcher = batcher
+        self.max_body_bytes = max_body_bytes
+
+    def prepare(self, body, content_type, name):
+        """A PreparedImage from a request body; raises ValueError for unusable input"""
+        if content_type == "application/x-npy":
+            try:
+                model_array = np.load(io.BytesIO(body), allow_pickle=False)
+            except Exception as e:
+                raise ValueError(f"not a readable .npy array: {e}") from e
+            if model_array.dtype != np.uint8 or model_array.ndim != 3 or model_array.shape[2] != 3:
+                raise ValueError(f"expected a uint8 (H, W, 3) array, got {model_array.dtype} {model_array.shape}")
+            if min(model_array.shape[:2]) < 1 or max(model_array.shape[:2]) > MAX_ARRAY_SIDE:
+                raise ValueError(f"array sides must be between 1 and {MAX_ARRAY_SIDE} pixels, "
+                                 f"got {model_array.shape[:2]}")
+            # Keyed on the bytes we received, never on a client's claim; prefixed so an
+            # array can never share a cache entry with an encoded image
+            content_hash = "npy:" + hashlib.sha256(body).hexdigest()
+            return PreparedImage(name, np.ascontiguousarray(model_array), None, model_array.shape[1::-1], content_hash)
+        prepared = self.storyteller.prepare(io.BytesIO(body))
+        prepared.name = name
+        return prepared
+
+    def classify(self, prepared, language=None):
+        result = self.storyteller._cached_result(prepared)
+        if not result:
+            result = self.batcher.submit(prepared).result()
+        if not result:
+            return None
+        response = result_to_json(result)
+        if language:
+            response['story'] = self.storyteller.get_story(result['primary_class'], language)
+        return response
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            params = urllib.parse.parse_qs(url.query)
+            if url.path == "/health":
+                self._send_json(200, {
+                    'model_loaded': service.storyteller.model is not None,
+                    'batching': service.batcher.stats(),
+                    'process_rss_bytes': current_rss_bytes(),
+                    'cache': service.storyteller.prediction_cache.stats(),
+                })
+            elif url.path == "/metrics":
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif url.path == "/story":
+                batik_class = params.get("class", [""])[0]
+                if not batik_class:
+                    self._send_json(400, {'error': "missing 'class'"})
+                    return
+                language = params.get("lang", [service.storyteller.current_language])[0]
+                self._send_json(200, service.storyteller.get_story(batik_class, language))
+            else:
+                self._send_json(404, {'error': "not found"})
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path != "/classify":
+                self._send_json(404, {'error': "not found"})
+                return
+            params = urllib.parse.parse_qs(url.query)
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length < 0 or length > service.max_body_bytes:
+                # The body is left unread, so this connection cannot be reused
+                self.close_connection = True
+                self._send_json(413 if length > 0 else 400,
+                                {'error': f"body must be at most {service.max_body_bytes} bytes"})
+                return
+            body = self.rfile.read(length)
+            if not body:
+                self._send_json(400, {'error': "empty body"})
+                return
+
+            name = urllib.parse.unquote(self.headers.get("X-Filename", "image"))
+            try:
+                prepared = service.prepare(body, self.headers.get("Content-Type"), name)
+            except Exception as e:
+                self._send_json(400, {'error': f"could not read image: {e}"})
+                return
+
+            try:
+                response = service.classify(prepared, params.get("lang", [None])[0])
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            if response is None:
+                self._send_json(422, {'error': "could not classify image"})
+                return
+            self._send_json(200, response)
+
+        def log_message(self, format, *args):
+            # Keep the console quiet; /health has the numbers
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batik classification and story service")
+    parser.add_argument("--model", default="runs/classify/batik_75epochsv2/weights/best.pt")
+    parser.add_argument("--backend", choices=["torch", "onnxruntime", "openvino"],
+                        help="Inference runtime (default: $BATIK_MODEL_BACKEND or torch)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--max-body-mb", type=float, default=DEFAULT_MAX_BODY_BYTES / 2**20,
+                        help="Largest request body accepted")
+    args = parser.parse_args(argv)
+
+    from Batik_Web_App_Test import BatikStoryTeller
+
+    storyteller = BatikStoryTeller(model_path=args.model, backend=args.backend)
+    batcher = MicroBatcher(storyteller, args.max_batch_size, args.max_wait_ms)
+    service = InferenceService(storyteller, batcher, int(args.max_body_mb * 2**20))
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Batik inference service on http://{args.host}:{args.port} "
+          f"(model {'loaded' if storyteller.model is not None else 'missing, demo mode'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+# loadtest.py
+"""Concurrent-session load test: how the app scales as visitors pile up.
+
+    python loadtest.py                                   # 1, 5, 10, 25, 50 sessions
+    python loadtest.py --sessions 1 10 50 --duration 60
+    python loadtest.py --url http://127.0.0.1:8502       # thin-client sessions against inference_service.py
+    python loadtest.py --save-baseline                   # store this curve to compare later releases with
+
+Streamlit runs every browser session as a thread in one server process,
+so each simulated session here is a thread running the same steps the
+script runs for a visitor: upload (decode), analyze (classify_image),
+switch language (story lookup + card render) and generate audio (through
+a local TTS stub, so gTTS and the network stay out of the numbers).
+Process-wide state (model registry, inference pool) is shared exactly as
+it is in the server.
+
+By default every flow is a new image to the model: each upload's model
+array is stamped with a flow number, and the prediction and narration
+caches are off, so the curve measures inference and synthesis under
+concurrency. ``--cache`` turns both caches on and replays the same
+``--images`` uploads, to measure a warm-cache deployment instead.
+
+For each concurrency level it reports throughput, per-step and
+end-to-end p50/p95/p99 latency, error rate and peak server RSS, and
+writes the curve to loadtest_results.json.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+from benchmark import Upload, percentile, stub_tts_backend, synthetic_jpeg
+
+DEFAULT_MODEL = "best.pt"
+DEFAULT_OUTPUT = "loadtest_results.json"
+DEFAULT_BASELINE = "loadtest_baseline.json"
+DEFAULT_SESSIONS = (1, 5, 10, 25, 50)
+STEPS = ("upload", "analyze", "switch_language", "audio")
+
+
+class RssMonitor:
+    """Samples server RSS on a background thread and keeps the peak"""
+
+    def __init__(self, read_rss, interval=0.2):
+        self.read_rss = read_rss
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-monitor", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                rss = self.read_rss()
+            except Exception:
+                rss = None
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def make_session_factory(args):
+    """Returns a function building one visitor's storyteller (as session_storyteller does)"""
+    from Batik_Web_App_Test import BatikStoryTeller, RemoteStoryTeller
+    from prediction_cache import PredictionCache
+
+    backend = stub_tts_backend(args.tts_delay_ms)
+
+    def make_storyteller():
+        storyteller = RemoteStoryTeller(args.url) if args.url else BatikStoryTeller(model_path=args.model)
+        storyteller.tts_backend = backend
+        if not args.cache:
+            # Every analyze must reach the model, as benchmark.py does
+            storyteller.prediction_cache = PredictionCache(max_entries=0)
+        return storyteller
+
+    return make_storyteller
+
+
+def stamp_flow(prepared, flow):
+    """Make an upload unique to one flow, so no cache (here or in a remote service) can answer it"""
+    import numpy as np
+
+    array = prepared.model_array.copy()
+    array.reshape(-1)[:8] = np.frombuffer(flow.to_bytes(8, "little"), dtype=np.uint8)
+    prepared.model_array = array
+    prepared.content_hash = f"{prepared.content_hash}:{flow}"
+    return prepared
+
+
+def run_session(storyteller, images, languages, deadline, samples, errors, counts, unique=True):
+    """One visitor looping over the app's flow until ``deadline``"""
+    from image_pipeline import prepare_image
+    from story_cards import get_card_renderer
+
+    i = 0
+    while time.perf_counter() < deadline:
+        name, data = images[i % len(images)]
+        i += 1
+        timings = {}
+        try:
+            start = time.perf_counter()
+            prepared = prepare_image(Upload(data, name), model_size=storyteller.model_size)
+            timings['upload'] = time.perf_counter() - start
+            if unique:
+                stamp_flow(prepared, next(counts['flows']))
+
+            start = time.perf_counter()
+            storyteller.current_language = languages[0]
+            result = storyteller.classify_image(prepared)
+            timings['analyze'] = time.perf_counter() - start
+            if not result:
+                raise RuntimeError("classify_image returned no result")
+
+            start = time.perf_counter()
+            storyteller.current_language = languages[-1]
+            story_data = storyteller.get_story(result['primary_class'])
+            get_card_renderer().render(result['primary_class'], languages[-1], result['confidence'], story_data)
+            timings['switch_language'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            chunks = list(storyteller.stream_audio(story_data))
+            timings['audio'] = time.perf_counter() - start
+            if not chunks:
+                raise RuntimeError("no audio produced")
+        except Exception as e:
+            with counts['lock']:
+                errors.append(f"{type(e).__name__}: {e}")
+            continue
+
+        with counts['lock']:
+            for step, seconds in timings.items():
+                samples[step].append(seconds * 1000.0)
+            samples['flow'].append(sum(timings.values()) * 1000.0)
+            counts['completed'] += 1
+
+
+def summarize_samples(samples_ms):
+    samples = sorted(samples_ms)
+    return {
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+    }
+
+
+def run_level(sessions, make_storyteller, images, languages, duration, read_rss, unique=True, flows=None):
+    """Run ``sessions`` concurrent visitors for ``duration`` seconds"""
+    storytellers = [make_storyteller() for _ in range(sessions)]
+    samples = {step: [] for step in STEPS + ('flow',)}
+    errors = []
+    counts = {'completed': 0, 'lock': threading.Lock(), 'flows': flows or itertools.count()}
+
+    with RssMonitor(read_rss) as monitor:
+        start = time.perf_counter()
+        deadline = start + duration
+        threads = [
+            threading.Thread(target=run_session, name=f"session-{i}",
+                             args=(storyteller, images, languages, deadline, samples, errors, counts, unique))
+            for i, storyteller in enumerate(storytellers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    attempts = counts['completed'] + len(errors)
+    level = dict({
+        'sessions': sessions,
+        'completed_flows': counts['completed'],
+        'throughput_flows_per_s': counts['completed'] / elapsed if elapsed > 0 else 0.0,
+        'error_rate': len(errors) / attempts if attempts else 0.0,
+        'peak_rss_bytes': monitor.peak,
+        'steps': {step: summarize_samples(samples[step]) for step in STEPS},
+        'sample_errors': sorted(set(errors))[:5],
+    }, **summarize_samples(samples['flow']))
+    return level
+
+
+def compare_to_baseline(curve, baseline, tolerance):
+    """Levels whose throughput fell or flow p95 rose by more than ``tolerance``"""
+    previous = {level['sessions']: level for level in baseline.get('curve', [])}
+    regressions = []
+    for level in curve:
+        old = previous.get(level['sessions'])
+        if not old:
+            continue
+        slower = old.get('p95_ms') and level['p95_ms'] and level['p95_ms'] > old['p95_ms'] * (1.0 + tolerance)
+        fewer = old['throughput_flows_per_s'] and \
+            level['throughput_flows_per_s'] < old['throughput_flows_per_s'] * (1.0 - tolerance)
+        if slower or fewer:
+            level['baseline'] = {key: old[key] for key in ('throughput_flows_per_s', 'p95_ms')}
+            regressions.append(level)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the app with concurrent simulated sessions")
+    parser.add_argument("--sessions", type=int, nargs="+", default=list(DEFAULT_SESSIONS),
+                        help="Concurrency levels to run, in order")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per concurrency level")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--url", help="Inference service URL (thin-client sessions)")
+    parser.add_argument("--languages", nargs=2, default=["en", "ms"], metavar=("FIRST", "SWITCH_TO"))
+    parser.add_argument("--images", type=int, default=32, help="Distinct synthetic uploads to cycle through")
+    parser.add_argument("--cache", action="store_true",
+                        help="Keep the prediction and narration caches on and replay the same uploads")
+    parser.add_argument("--image-size", type=int, default=1600)
+    parser.add_argument("--tts-delay-ms", type=float, default=50.0, help="Latency of the TTS stub per sentence")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    from audio_cache import DEFAULT_MAX_BYTES, AudioCache, _caches
+    from model_registry import current_rss_bytes
+
+    if args.url:
+        from inference_client import InferenceClient
+        client = InferenceClient(args.url)
+        read_rss = lambda: client.health().get('process_rss_bytes')
+    else:
+        read_rss = current_rss_bytes
+
+    make_storyteller = make_session_factory(args)
+    probe = make_storyteller()
+    if not args.url and probe.model is None:
+        # Demo mode answers with random labels and no inference: its curve would mean nothing
+        print(f"Could not load the model from {args.model} (a load test needs real predictions; "
+              f"pass --model, or --url for a running inference service)")
+        return 1
+    images = [(f"load_{seed}.jpg", synthetic_jpeg(args.image_size, seed=seed)) for seed in range(args.images)]
+
+    curve = []
+    with tempfile.TemporaryDirectory() as audio_dir:
+        backend = probe.tts_backend
+        # A fresh audio cache that keeps nothing unless --cache, so narrations are really synthesized
+        _caches[backend.name] = AudioCache(audio_dir, max_bytes=DEFAULT_MAX_BYTES if args.cache else 0,
+                                           extension=backend.extension)
+        # Flow numbers keep counting across levels, so no level reuses another's uploads
+        flows = itertools.count()
+
+        print(f"{'sessions':>8s} {'flows/s':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} "
+              f"{'errors':>7s} {'peak RSS':>9s}")
+        for sessions in args.sessions:
+            level = run_level(sessions, make_storyteller, images, args.languages, args.duration, read_rss,
+                              unique=not args.cache, flows=flows)
+            curve.append(level)
+            rss = f"{level['peak_rss_bytes'] / 2**20:.0f} MB" if level['peak_rss_bytes'] else "-"
+            p50, p95, p99 = (f"{level[key]:9.1f}" if level[key] is not None else f"{'-':>9s}"
+                             for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+            print(f"{sessions:8d} {level['throughput_flows_per_s']:9.2f} {p50} {p95} {p99} "
+                  f"{level['error_rate']:7.1%} {rss:>9s}")
+
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'mode': 'remote' if args.url else 'in-process',
+        'model': args.model,
+        'duration_s': args.duration,
+        'caches': bool(args.cache),
+        'curve': curve,
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(curve, json.load(f), args.tolerance)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Scaling curve written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"\n❌ SCALING REGRESSION at {len(regressions)} concurrency level(s) (tolerance {args.tolerance:.0%})")
+        for level in regressions:
+            old = level['baseline']
+            print(f"   {level['sessions']} sessions: {old['throughput_flows_per_s']:.2f} -> "
+                  f"{level['throughput_flows_per_s']:.2f} flows/s, p95 {old['p95_ms']:.1f} -> {level['p95_ms']:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
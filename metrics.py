@@ -0,0 +1,252 @@
+# metrics.py
+"""Per-stage latency spans, counters and a Prometheus text endpoint.
+
+Enable with BATIK_METRICS=1 (and BATIK_METRICS_PORT=9108 to serve
+/metrics). When disabled, ``span`` hands back a shared no-op context
+manager and ``inc`` returns straight away, so instrumented code pays one
+attribute lookup and one branch.
+"""
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ENV = "BATIK_METRICS"
+METRICS_PORT_ENV = "BATIK_METRICS_PORT"
+
+# Seconds; covers a fast story lookup up to a slow gTTS round trip
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get(METRICS_ENV, "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_local = threading.local()
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Add to a counter, e.g. ``inc("batik_errors_total", stage="predict")``"""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Record a value (seconds, unless other ``buckets`` are given) in a histogram"""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+class Trace:
+    """Stage timings for one user request (shown in the debug panel)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.started = time.perf_counter()
+        self.total = None
+
+    def add(self, stage, seconds):
+        self.stages.append((stage, seconds))
+
+    def as_rows(self):
+        return [{'stage': stage, 'ms': seconds * 1000.0} for stage, seconds in self.stages]
+
+
+class _Span:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        observe("batik_stage_seconds", seconds, stage=self.stage)
+        if exc_type is not None:
+            inc("batik_errors_total", stage=self.stage)
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            trace.add(self.stage, seconds)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage):
+    """Time a stage: ``with metrics.span("predict"): ...``"""
+    if not _enabled:
+        return _NOOP
+    return _Span(stage)
+
+
+def record(stage, seconds):
+    """Add an already measured stage, as if it had been timed with ``span``"""
+    if not _enabled:
+        return
+    observe("batik_stage_seconds", seconds, stage=stage)
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+class _TraceContext:
+    def __init__(self, trace, resumed=False):
+        self.trace = trace
+        self.resumed = resumed
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'trace', None)
+        _local.trace = self.trace
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.total = time.perf_counter() - self.trace.started
+        _local.trace = self.previous
+        if not self.resumed:
+            observe("batik_request_seconds", self.trace.total, kind=self.trace.name)
+        return False
+
+
+def trace(name):
+    """Collect every span inside the block into one Trace (a no-op when disabled)"""
+    if not _enabled:
+        return _NOOP
+    return _TraceContext(Trace(name))
+
+
+def resume(trace):
+    """Add the spans inside the block to an already finished ``trace`` and extend its total.
+
+    For stages of the same request that run after the trace block closed
+    (e.g. rendering the result of an analyze). ``batik_request_seconds``
+    is only observed once, when the trace first closes.
+    """
+    if not _enabled or not isinstance(trace, Trace):
+        return _NOOP
+    return _TraceContext(trace, resumed=True)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = ('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus():
+    """All counters and histograms in Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, (list(h.counts), h.count, h.sum, h.buckets)) for key, h in _histograms.items())
+
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), (counts, count, total, buckets) in histograms:
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', repr(bound))])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """Serve /metrics from a background thread, once per process"""
+    global _server
+    port = port or os.environ.get(METRICS_PORT_ENV)
+    if not _enabled or not port:
+        return None
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    return _server
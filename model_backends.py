@@ -0,0 +1,199 @@
+# model_backends.py
+"""Export best.pt to CPU-friendly runtimes and check they stay accurate.
+
+    python model_backends.py export --backend onnxruntime [--int8]
+    python model_backends.py export --backend openvino [--int8]
+    python model_backends.py compare --weights best.pt
+
+The app picks a backend through BATIK_MODEL_BACKEND (torch, onnxruntime or
+openvino) and BATIK_MODEL_INT8=1. ultralytics loads .onnx files and
+OpenVINO model directories itself, so predictions come back in the same
+Results shape whichever runtime is underneath.
+"""
+import argparse
+import glob
+import os
+import shutil
+import statistics
+import sys
+import time
+
+MODEL_BACKEND_ENV = "BATIK_MODEL_BACKEND"
+MODEL_INT8_ENV = "BATIK_MODEL_INT8"
+BACKENDS = ('torch', 'onnxruntime', 'openvino')
+DEFAULT_BACKEND = 'torch'
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample images")
+
+
+def configured_backend():
+    """The (backend, int8) pair chosen through the environment"""
+    backend = os.environ.get(MODEL_BACKEND_ENV, DEFAULT_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    int8 = os.environ.get(MODEL_INT8_ENV, "").lower() in ("1", "true", "yes")
+    return backend, int8
+
+
+def artifact_path(pt_path, backend, int8=False):
+    """Where the exported model for ``backend`` lives next to ``pt_path``"""
+    stem = os.path.splitext(pt_path)[0]
+    if backend == 'torch':
+        return pt_path
+    if backend == 'onnxruntime':
+        return f"{stem}.int8.onnx" if int8 else f"{stem}.onnx"
+    if backend == 'openvino':
+        return f"{stem}_int8_openvino_model" if int8 else f"{stem}_openvino_model"
+    raise ValueError(f"Unknown model backend: {backend}")
+
+
+def resolve_weights(pt_path, backend=None, int8=None):
+    """Return (path, backend) to load, falling back to torch if not exported"""
+    configured, configured_int8 = configured_backend()
+    backend = backend or configured
+    int8 = configured_int8 if int8 is None else int8
+    path = artifact_path(pt_path, backend, int8)
+    if backend != 'torch' and not os.path.exists(path):
+        return pt_path, 'torch'
+    return path, backend
+
+
+def export(pt_path, backend, int8=False, imgsz=None):
+    """Export ``pt_path`` for ``backend`` and return the artifact path"""
+    from ultralytics import YOLO
+
+    if backend == 'torch':
+        return pt_path
+
+    model = YOLO(pt_path)
+    imgsz = imgsz or model.overrides.get('imgsz', 224)
+    target = artifact_path(pt_path, backend, int8)
+
+    if backend == 'onnxruntime':
+        onnx_path = model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+        if not int8:
+            return onnx_path
+        # Dynamic quantization: INT8 weights, activations quantized on the fly
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, target, weight_type=QuantType.QUInt8)
+        return target
+
+    if backend == 'openvino':
+        exported = model.export(format='openvino', imgsz=imgsz, int8=int8)
+        if os.path.abspath(exported) != os.path.abspath(target):
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            shutil.move(exported, target)
+        return target
+
+    raise ValueError(f"Unknown model backend: {backend}")
+
+
+def load(path):
+    from ultralytics import YOLO
+
+    # task must be given explicitly: exported files carry no .pt metadata
+    return YOLO(path, task='classify')
+
+
+def sample_images(directory=SAMPLE_DIR):
+    patterns = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+    return sorted(path for pattern in patterns for path in glob.glob(os.path.join(directory, pattern)))
+
+
+def top1_predictions(model, arrays):
+    return [int(result.probs.top1) for result in model.predict(arrays, verbose=False)]
+
+
+def latency_ms(model, array, repeats=30, warmup=3):
+    for _ in range(warmup):
+        model.predict(array, verbose=False)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(array, verbose=False)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples.sort()
+    return {
+        'p50': statistics.median(samples),
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'mean': statistics.fmean(samples),
+    }
+
+
+def compare(pt_path, candidates, images, repeats=30):
+    """Check top-1 parity against torch and time every available candidate"""
+    from image_pipeline import model_input_size, prepare_image
+
+    reference = load(pt_path)
+    size = model_input_size(reference)
+    arrays = [prepare_image(path, model_size=size).model_array for path in images]
+    expected = top1_predictions(reference, arrays)
+
+    rows = [{
+        'backend': 'torch', 'path': pt_path, 'parity': True,
+        'latency': latency_ms(reference, arrays[0], repeats),
+    }]
+    for backend, int8 in candidates:
+        path = artifact_path(pt_path, backend, int8)
+        label = f"{backend}{' int8' if int8 else ''}"
+        if not os.path.exists(path):
+            rows.append({'backend': label, 'path': path, 'parity': None, 'latency': None})
+            continue
+        model = load(path)
+        predicted = top1_predictions(model, arrays)
+        mismatches = [os.path.basename(image) for image, a, b in zip(images, expected, predicted) if a != b]
+        rows.append({
+            'backend': label, 'path': path, 'parity': not mismatches, 'mismatches': mismatches,
+            'latency': latency_ms(model, arrays[0], repeats),
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and compare CPU inference backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="Export the classifier for a backend")
+    export_parser.add_argument("--weights", default="best.pt")
+    export_parser.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    export_parser.add_argument("--int8", action="store_true", help="Quantize to INT8")
+    export_parser.add_argument("--imgsz", type=int)
+
+    compare_parser = sub.add_parser("compare", help="Top-1 parity and latency per backend")
+    compare_parser.add_argument("--weights", default="best.pt")
+    compare_parser.add_argument("--images", default=SAMPLE_DIR)
+    compare_parser.add_argument("--repeats", type=int, default=30)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        path = export(args.weights, args.backend, int8=args.int8, imgsz=args.imgsz)
+        print(f"Exported {args.backend}{' (INT8)' if args.int8 else ''} model to {path}")
+        print(f"Serve it with {MODEL_BACKEND_ENV}={args.backend}" + (f" {MODEL_INT8_ENV}=1" if args.int8 else ""))
+        return 0
+
+    images = sample_images(args.images)
+    if not images:
+        print(f"No images found in {args.images}")
+        return 1
+    candidates = [(backend, int8) for backend in BACKENDS[1:] for int8 in (False, True)]
+    rows = compare(args.weights, candidates, images, args.repeats)
+
+    print(f"{'backend':20s} {'top-1 parity':14s} {'p50 ms':>8s} {'p95 ms':>8s}")
+    failed = False
+    for row in rows:
+        if row['latency'] is None:
+            print(f"{row['backend']:20s} {'not exported':14s}")
+            continue
+        parity = "match" if row['parity'] else f"MISMATCH ({', '.join(row['mismatches'])})"
+        failed = failed or not row['parity']
+        print(f"{row['backend']:20s} {parity:14s} {row['latency']['p50']:8.2f} {row['latency']['p95']:8.2f}")
+
+    accurate = [row for row in rows if row['parity'] and row['latency']]
+    fastest = min(accurate, key=lambda row: row['latency']['p50'])
+    print(f"Fastest backend matching torch on {len(images)} sample images: {fastest['backend']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
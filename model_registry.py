@@ -0,0 +1,239 @@
+# model_registry.py
+import os
+import sys
+import threading
+import time
+
+
+def current_rss_bytes():
+    """Resident memory of this process in bytes, or None if unknown"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    # Linux without psutil
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    # Peak (not current) RSS is the best we can do elsewhere on POSIX
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+def _load_yolo(model_path):
+    # Imported here so the registry module stays cheap to import
+    from ultralytics import YOLO
+    # Exported ONNX/OpenVINO models carry no task metadata, so name it
+    return YOLO(model_path, task='classify')
+
+
+class SharedModel:
+    """A model shared across threads, whose calls are serialised by a lock.
+
+    The ultralytics predictor keeps each call's state on itself (dataset,
+    batch, results), so two threads predicting on one instance at once can
+    get each other's answers. Everything else is passed straight through.
+    """
+
+    def __init__(self, model):
+        self._model = model
+        # Re-entrant, so code holding the lock (e.g. to add a hook) can still predict
+        self.lock = threading.RLock()
+
+    def predict(self, *args, **kwargs):
+        with self.lock:
+            return self._model.predict(*args, **kwargs)
+
+    __call__ = predict
+
+    def export(self, *args, **kwargs):
+        with self.lock:
+            return self._model.export(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class ModelEntry:
+    """A loaded model together with the facts we report about it"""
+
+    def __init__(self, path, mtime, model, load_seconds, warmup_seconds, rss_delta_bytes):
+        self.path = path
+        self.mtime = mtime
+        self.model = model
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+        self.rss_delta_bytes = rss_delta_bytes
+        self.loaded_at = time.time()
+        self.hits = 0
+
+    @property
+    def key(self):
+        return (self.path, self.mtime)
+
+    def as_dict(self):
+        return {
+            'path': self.path,
+            'mtime': self.mtime,
+            'load_seconds': self.load_seconds,
+            'warmup_seconds': self.warmup_seconds,
+            'rss_delta_bytes': self.rss_delta_bytes,
+            'loaded_at': self.loaded_at,
+            'hits': self.hits,
+        }
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models, keyed by weights path and mtime.
+
+    Every Streamlit session and rerun shares the same registry, so each
+    weights file is loaded (and warmed up) once and the same instance is
+    handed back to every caller, wrapped in a SharedModel so concurrent
+    sessions take turns on it. If the file on disk changes, the next
+    ``get`` loads the new weights and drops the stale instance.
+    """
+
+    def __init__(self, loader=_load_yolo, warmup=True):
+        self._loader = loader
+        self._warmup = warmup
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._path_locks = {}
+        self._preloads = {}
+
+    def _path_lock(self, path):
+        with self._lock:
+            if path not in self._path_locks:
+                self._path_locks[path] = threading.Lock()
+            return self._path_locks[path]
+
+    def get(self, model_path):
+        """Return the shared model for ``model_path``, loading it on first use"""
+        path = os.path.abspath(model_path)
+        mtime = os.path.getmtime(path)
+
+        entry = self._entries.get(path)
+        if entry is not None and entry.mtime == mtime:
+            entry.hits += 1
+            return entry.model
+
+        # One loader per path; other paths can load at the same time
+        with self._path_lock(path):
+            entry = self._entries.get(path)
+            if entry is None or entry.mtime != mtime:
+                entry = self._load(path, mtime)
+                with self._lock:
+                    self._entries[path] = entry
+            entry.hits += 1
+            return entry.model
+
+    def _load(self, path, mtime):
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        model = self._loader(path)
+        load_seconds = time.perf_counter() - start
+
+        warmup_seconds = 0.0
+        if self._warmup:
+            start = time.perf_counter()
+            warm_up(model)
+            warmup_seconds = time.perf_counter() - start
+
+        rss_after = current_rss_bytes()
+        rss_delta = None
+        if rss_before is not None and rss_after is not None:
+            rss_delta = rss_after - rss_before
+
+        return ModelEntry(path, mtime, SharedModel(model), load_seconds, warmup_seconds, rss_delta)
+
+    def preload(self, model_path):
+        """Load and warm up ``model_path`` on a background thread, once per path.
+
+        Returns the readiness dict (see ``readiness``). A ``get`` for the same
+        path while the load is running simply waits for it to finish.
+        """
+        path = os.path.abspath(model_path)
+        with self._lock:
+            status = self._preloads.get(path)
+            if status is not None:
+                return status
+            status = self._preloads[path] = {'state': 'loading', 'error': None, 'seconds': None}
+        threading.Thread(target=self._preload, args=(path, status), name="model-preload", daemon=True).start()
+        return status
+
+    def _preload(self, path, status):
+        start = time.perf_counter()
+        try:
+            self.get(path)
+            status['state'] = 'ready'
+        except Exception as e:
+            status['error'] = str(e)
+            status['state'] = 'failed'
+        status['seconds'] = time.perf_counter() - start
+
+    def readiness(self, model_path):
+        """'loading', 'ready' or 'failed' (with error and seconds) for a preloaded path, else None"""
+        path = os.path.abspath(model_path)
+        status = self._preloads.get(path)
+        if status is None and path in self._entries:
+            return {'state': 'ready', 'error': None, 'seconds': None}
+        return status
+
+    def reload(self, model_path):
+        """Force the weights at ``model_path`` to be loaded again"""
+        self.evict(model_path)
+        return self.get(model_path)
+
+    def evict(self, model_path=None):
+        """Drop one model (or every model when no path is given)"""
+        with self._lock:
+            if model_path is None:
+                evicted = len(self._entries)
+                self._entries.clear()
+                return evicted
+            return int(self._entries.pop(os.path.abspath(model_path), None) is not None)
+
+    def entry(self, model_path):
+        """Return the ModelEntry for ``model_path`` if it is loaded"""
+        return self._entries.get(os.path.abspath(model_path))
+
+    def stats(self):
+        """Load time and memory figures for every resident model"""
+        with self._lock:
+            entries = [entry.as_dict() for entry in self._entries.values()]
+        return {
+            'models': entries,
+            'process_rss_bytes': current_rss_bytes(),
+        }
+
+
+def warm_up(model, size=64):
+    """Run one dummy inference so the first real request is not the slow one"""
+    import numpy as np
+
+    dummy = np.zeros((size, size, 3), dtype=np.uint8)
+    model.predict(dummy, verbose=False)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the registry shared by every session in this process"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
@@ -0,0 +1,135 @@
+# prediction_cache.py
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Set this to a file path to keep predictions across restarts
+CACHE_DB_ENV = "BATIK_PREDICTION_CACHE"
+DEFAULT_MAX_ENTRIES = 2048
+
+# Only the label is cached; image arrays are rebuilt from the upload
+CACHED_FIELDS = ('primary_class', 'confidence', 'class_id')
+
+
+def model_identity(model_path):
+    """Identify a weights file by path and modification time"""
+    path = os.path.abspath(model_path)
+    return f"{path}@{os.stat(path).st_mtime_ns}"
+
+
+class PredictionCache:
+    """Content-addressed LRU cache of classification results.
+
+    Entries are keyed by the hash of the uploaded bytes plus the model
+    identity, so a changed weights file never serves old answers. When
+    ``db_path`` is given, entries are also written to SQLite and survive a
+    restart; the in-memory LRU sits in front of it.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, db_path=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " content_hash TEXT NOT NULL,"
+                " model_id TEXT NOT NULL,"
+                " result TEXT NOT NULL,"
+                " PRIMARY KEY (content_hash, model_id))"
+            )
+            self._db.commit()
+
+    def get(self, content_hash, model_id):
+        """Return the cached result dict, or None on a miss"""
+        key = (content_hash, model_id)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(self._entries[key])
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result FROM predictions WHERE content_hash = ? AND model_id = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    result = json.loads(row[0])
+                    self._remember(key, result)
+                    self.hits += 1
+                    return dict(result)
+
+            self.misses += 1
+            return None
+
+    def put(self, content_hash, model_id, result):
+        """Store the label fields of a classification result"""
+        key = (content_hash, model_id)
+        entry = {field: result[field] for field in CACHED_FIELDS}
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)",
+                    (content_hash, model_id, json.dumps(entry)),
+                )
+                self._db.commit()
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_model(self, model_path, keep=None):
+        """Drop entries for ``model_path`` whose identity is not ``keep``"""
+        prefix = os.path.abspath(model_path) + "@"
+        with self._lock:
+            stale = [key for key in self._entries if key[1].startswith(prefix) and key[1] != keep]
+            for key in stale:
+                del self._entries[key]
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM predictions WHERE substr(model_id, 1, ?) = ? AND model_id != ?",
+                    (len(prefix), prefix, keep or ""),
+                )
+                self._db.commit()
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'persistent': self._db is not None,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_prediction_cache():
+    """Return the prediction cache shared by every session in this process"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PredictionCache(db_path=os.environ.get(CACHE_DB_ENV))
+    return _cache
@@ -0,0 +1,373 @@
+# similarity_index.py
+"""Embedding index behind the "find similar batik" panel.
+
+    python similarity_index.py build /archive/batik         # embed every image (skips ones already indexed)
+    python similarity_index.py query some_fabric.jpg -k 5
+    python similarity_index.py stats
+    python similarity_index.py bench --items 100000         # search latency on a synthetic index
+
+Embeddings are the classifier's penultimate-layer features (the pooled
+input of the Classify head's final linear layer), L2-normalised
+and stored as a float16 matrix in ``vectors.f16`` with one JSON line per
+row in ``ids.jsonl``. ``index.json`` holds the row count and is rewritten
+last, so readers only ever see committed rows (even while ``build`` is
+appending) and an interrupted append is cut off by the next writer.
+
+Search is one matrix-vector product plus ``argpartition``. The float16
+file is memory-mapped (100k x 1280 dims is 256 MB) and scanned in blocks
+converted to float32, because NumPy has no fast float16 matmul: about
+260 ms per query at that size on our test box. With ``resident=True`` a
+float32 copy of the whole matrix is kept in RAM instead, about 35 ms per
+query but another 512 MB, so the app only does so when
+BATIK_SIMILARITY_RESIDENT=1. ``python similarity_index.py bench``
+measures both on the machine at hand.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+INDEX_ENV = "BATIK_SIMILARITY_INDEX"
+RESIDENT_ENV = "BATIK_SIMILARITY_RESIDENT"
+# The pooled features entering the YOLOv8 Classify head's linear layer
+EMBEDDING_DIM = 1280
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "similarity_index")
+DEFAULT_MODEL = "runs/classify/batik_75epochsv2/weights/best.pt"
+SCAN_BLOCK_ROWS = 16384
+
+
+def normalize_rows(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _classify_head(model):
+    """The Classify module at the end of a PyTorch YOLO classifier"""
+    layers = getattr(getattr(model, 'model', None), 'model', None)
+    head = layers[-1] if layers is not None and len(layers) else None
+    if head is None or not hasattr(head, 'linear'):
+        raise RuntimeError("Embeddings need the PyTorch classification weights (.pt), not an exported model")
+    return head
+
+
+def extract_embeddings(model, arrays):
+    """Penultimate-layer features for a batch of model-sized BGR arrays, shape (n, dim).
+
+    ultralytics 8.0.x has no ``model.embed``, so a forward pre-hook on the
+    Classify head's ``linear`` layer catches its input (the pooled features)
+    during an ordinary predict.
+    """
+    arrays = list(arrays)
+    linear = _classify_head(model).linear
+    features = []
+
+    def hook(module, inputs):
+        features.append(inputs[0].detach().float().cpu().numpy())
+
+    # Hold the shared model's lock throughout, so no other thread's predict feeds the hook
+    with getattr(model, 'lock', None) or contextlib.nullcontext():
+        handle = linear.register_forward_pre_hook(hook)
+        try:
+            model.predict(arrays, verbose=False)
+        finally:
+            handle.remove()
+
+    vectors = np.concatenate(features) if features else np.zeros((0, 0), dtype=np.float32)
+    if len(vectors) < len(arrays):
+        raise RuntimeError(f"Got {len(vectors)} embeddings for {len(arrays)} images")
+    # A predictor's first call runs a warm-up pass first; the real batch comes last
+    return vectors[-len(arrays):].astype(np.float32)
+
+
+class SimilarityIndex:
+    """Append-only cosine-similarity index on a float16 memmap with an ID sidecar"""
+
+    def __init__(self, directory=DEFAULT_INDEX_DIR, resident=False):
+        self.directory = directory
+        self.resident = resident
+        self.dim = None
+        self.count = 0
+        self.info = {}
+        self.ids = []
+        self.metadata = []
+        self._id_set = set()
+        self._matrix = None
+        self._resident = None
+        self._ids_bytes = 0
+        self._repaired = False
+        self._lock = threading.Lock()
+        if os.path.exists(self._path("index.json")):
+            self._open()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item_id):
+        return item_id in self._id_set
+
+    def _open(self):
+        """Load the committed rows; never writes, so it is safe while another process appends"""
+        with open(self._path("index.json"), encoding="utf-8") as f:
+            self.info = json.load(f)
+        self.dim = self.info['dim']
+        self.count = self.info['count']
+
+        # Rows past the committed count may be half written: leave them alone
+        with open(self._path("ids.jsonl"), 'rb') as f:
+            lines = f.read().split(b"\n")[:self.count]
+        self._ids_bytes = sum(len(line) + 1 for line in lines)
+
+        self.metadata = [json.loads(line) for line in lines]
+        self.ids = [entry['id'] for entry in self.metadata]
+        self._id_set = set(self.ids)
+        self._map()
+
+    def _map(self):
+        if self.count == 0:
+            self._matrix = np.zeros((0, self.dim or 0), dtype=np.float16)
+        else:
+            # Only the committed rows are mapped, whatever follows them in the file
+            self._matrix = np.memmap(self._path("vectors.f16"), dtype=np.float16, mode='r',
+                                     shape=(self.count, self.dim))
+        self._resident = self._matrix.astype(np.float32) if self.resident else None
+
+    def append(self, ids, vectors, metadata=None, **info):
+        """Add rows (IDs already in the index are skipped); returns how many were added"""
+        vectors = normalize_rows(vectors)
+        metadata = metadata or [{} for _ in ids]
+        with self._lock:
+            keep = [i for i, item_id in enumerate(ids) if item_id not in self._id_set]
+            if not keep:
+                return 0
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                os.makedirs(self.directory, exist_ok=True)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding size {vectors.shape[1]} does not match the index ({self.dim})")
+            if not self._repaired:
+                self._discard_uncommitted()
+
+            rows = vectors[keep].astype(np.float16)
+            entries = [dict(metadata[i], id=ids[i]) for i in keep]
+            lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+            with open(self._path("vectors.f16"), 'ab') as f:
+                f.write(rows.tobytes())
+            with open(self._path("ids.jsonl"), 'ab') as f:
+                f.write(lines)
+
+            # Commit point: rows past the count in index.json do not exist
+            self.info.update(info, dim=self.dim, count=self.count + len(keep))
+            tmp_path = self._path("index.json.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.info, f, indent=2)
+            os.replace(tmp_path, self._path("index.json"))
+
+            self.count += len(keep)
+            self._ids_bytes += len(lines)
+            self.metadata.extend(entries)
+            self.ids.extend(entry['id'] for entry in entries)
+            self._id_set.update(entry['id'] for entry in entries)
+            if self._resident is not None and self._matrix is not None and len(self._matrix):
+                # Extend the float32 copy instead of converting the whole file again
+                self._matrix = np.memmap(self._path("vectors.f16"), dtype=np.float16, mode='r',
+                                         shape=(self.count, self.dim))
+                self._resident = np.concatenate([self._resident, rows.astype(np.float32)])
+            else:
+                self._map()
+            return len(keep)
+
+    def _discard_uncommitted(self):
+        """Cut off whatever an interrupted append left past the committed count (writers only)"""
+        for name, size in (("vectors.f16", self.count * self.dim * 2), ("ids.jsonl", self._ids_bytes)):
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, 'rb+') as f:
+                    f.truncate(size)
+        self._repaired = True
+
+    def scores(self, query):
+        """Cosine similarity of ``query`` against every row"""
+        query = normalize_rows(query)[0]
+        resident = self._resident
+        if resident is not None:
+            return resident @ query
+
+        matrix = self._matrix
+        out = np.empty(len(matrix), dtype=np.float32)
+        buffer = np.empty((min(SCAN_BLOCK_ROWS, len(matrix)), self.dim), dtype=np.float32)
+        for start in range(0, len(matrix), SCAN_BLOCK_ROWS):
+            block = matrix[start:start + SCAN_BLOCK_ROWS]
+            converted = buffer[:len(block)]
+            converted[...] = block
+            np.dot(converted, query, out=out[start:start + len(block)])
+        return out
+
+    def search(self, query, k=5, exclude=(), exclude_hash=None):
+        """Top-``k`` rows by cosine similarity: [{'id', 'score', **metadata}, ...].
+
+        Rows whose ID is in ``exclude``, or whose ``content_hash`` equals
+        ``exclude_hash`` (the query image itself, wherever it sits in the
+        collection), are skipped.
+        """
+        if self.count == 0:
+            return []
+        scores = self.scores(query)
+        wanted = min(len(scores), k + len(exclude) + 1)
+        while True:
+            top = np.argpartition(-scores, wanted - 1)[:wanted]
+            top = top[np.argsort(-scores[top])]
+            results = []
+            for row in top:
+                entry = self.metadata[row]
+                if entry['id'] in exclude or (exclude_hash and entry.get('content_hash') == exclude_hash):
+                    continue
+                results.append(dict(entry, score=float(scores[row])))
+                if len(results) == k:
+                    return results
+            if wanted == len(scores):
+                return results
+            # More rows were excluded than expected (e.g. duplicates of the query)
+            wanted = min(len(scores), wanted * 2)
+
+    def stats(self):
+        return {
+            'items': self.count,
+            'dim': self.dim,
+            'file_bytes': self.count * (self.dim or 0) * 2,
+            'resident_bytes': self._resident.nbytes if self._resident is not None else 0,
+            'root': self.info.get('root'),
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index():
+    """The process-wide index from BATIK_SIMILARITY_INDEX (or ./similarity_index), or None if not built"""
+    global _index
+    directory = os.environ.get(INDEX_ENV, DEFAULT_INDEX_DIR)
+    if _index is None:
+        if not os.path.exists(os.path.join(directory, "index.json")):
+            return None
+        resident = os.environ.get(RESIDENT_ENV, "").lower() in ("1", "true", "yes")
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex(directory, resident=resident)
+    return _index
+
+
+def build(root, index, model, batch_size=32):
+    """Embed every image under ``root`` that the index does not have yet"""
+    from catalogue import chunked, find_images
+    from image_pipeline import model_input_size, prepare_image
+
+    model_size = model_input_size(model)
+    todo = [path for path in find_images(root) if path not in index]
+    print(f"{len(index)} items indexed, {len(todo)} new images")
+    start = time.perf_counter()
+    added = 0
+    for batch in chunked(todo, batch_size):
+        prepared = []
+        for path in batch:
+            try:
+                prepared.append(prepare_image(os.path.join(root, path), model_size=model_size))
+            except Exception as e:
+                print(f"\nskipping {path}: {e}")
+        if not prepared:
+            continue
+        vectors = extract_embeddings(model, [p.model_array for p in prepared])
+        ids = [os.path.relpath(p.name, root) for p in prepared]
+        # The hash lets the app leave an upload's own entry out of its results
+        metadata = [{'content_hash': p.content_hash} for p in prepared]
+        added += index.append(ids, vectors, metadata, root=os.path.abspath(root))
+        rate = added / (time.perf_counter() - start)
+        print(f"\r{added}/{len(todo)} embedded | {rate:.1f} img/s", end="", flush=True)
+    print()
+    return added
+
+
+def bench(items, dim, queries=50, k=5):
+    """Median/max query latency on a synthetic index of ``items`` rows, scanned and resident"""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        writer = SimilarityIndex(directory)
+        for start in range(0, items, 10000):
+            rows = min(10000, items - start)
+            writer.append([f"item-{start + i}" for i in range(rows)], rng.standard_normal((rows, dim)))
+        del writer
+        for resident in (False, True):
+            index = SimilarityIndex(directory, resident=resident)
+            timings = []
+            for query in rng.standard_normal((queries, dim)):
+                t = time.perf_counter()
+                index.search(query, k)
+                timings.append(time.perf_counter() - t)
+            timings.sort()
+            results.append({'items': items, 'dim': dim, 'mode': 'resident' if resident else 'scan',
+                            'extra_ram_bytes': index.stats()['resident_bytes'],
+                            'p50_ms': timings[len(timings) // 2] * 1000.0, 'max_ms': timings[-1] * 1000.0})
+            del index
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the 'find similar batik' index")
+    parser.add_argument("command", choices=["build", "query", "stats", "bench"])
+    parser.add_argument("path", nargs="?", help="Image directory (build) or image file (query)")
+    parser.add_argument("--index", default=os.environ.get(INDEX_ENV, DEFAULT_INDEX_DIR))
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--items", type=int, default=100000, help="Rows in the synthetic bench index")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM, help="Embedding size for the bench index")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        for result in bench(args.items, args.dim, k=args.k):
+            print(f"{result['items']} x {result['dim']} ({result['mode']}, "
+                  f"+{result['extra_ram_bytes'] / 2**20:.0f} MB RAM): "
+                  f"p50 {result['p50_ms']:.1f} ms, max {result['max_ms']:.1f} ms")
+        return 0
+
+    index = SimilarityIndex(args.index)
+    if args.command == "stats":
+        print(json.dumps(index.stats(), indent=2))
+        return 0
+
+    if not args.path:
+        parser.error(f"{args.command} needs a path")
+    from model_registry import get_registry
+
+    model = get_registry().get(args.model)
+    if args.command == "build":
+        added = build(args.path, index, model, args.batch_size)
+        print(f"Added {added} items; the index now holds {len(index)}")
+        return 0
+
+    from image_pipeline import model_input_size, prepare_image
+
+    prepared = prepare_image(args.path, model_size=model_input_size(model))
+    start = time.perf_counter()
+    results = index.search(extract_embeddings(model, [prepared.model_array])[0], args.k)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        print(f"{result['score']:.3f}  {result['id']}")
+    print(f"({elapsed * 1000:.1f} ms including the embedding)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# story_cards.py
+"""Story cards as single HTML fragments from precompiled templates.
+
+A card used to be built from about 20 ``st.markdown`` calls. Now the
+sections a story has are compiled once into one ``str.format`` template
+per pattern family and field set. The finished HTML is cached per
+(class, language, displayed confidence, badge), so a repeat analysis or
+a language switch costs a dict lookup, and the card goes out in one
+element.
+"""
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_CARDS = 512
+# Confidence is shown to 0.1%, so buckets of that size lose nothing
+CONFIDENCE_BUCKETS = 1000
+HIGH_CONFIDENCE_PERCENT = 80
+
+COMMON_SECTIONS = [
+    ("📍 Origin", "origin"),
+    ("💫 Meaning", "meaning"),
+    ("🏛️ Cultural Significance", "cultural_significance"),
+    ("📚 Story", "story"),
+]
+# Extra sections shown for each pattern family, after the common ones
+FAMILY_SECTIONS = {
+    'bunga_raya': [
+        ("🏡 In Malaysian Homes", "home_context"),
+        ("🎨 Artistic Expression", "artistic_expression"),
+        ("💎 The Essence", "essence"),
+    ],
+    'geometri': [
+        ("🕌 Islamic Influence", "islamic_influence"),
+        ("🔶 Common Motifs & Stories", "motifs_stories"),
+        ("🏝️ Regional Heritage", "regional_heritage"),
+        ("🎨 Artistic Expression", "artistic_expression"),
+        ("💎 The Essence", "essence"),
+    ],
+}
+# Fields whose line breaks matter
+PRE_LINE_FIELDS = {'motifs_stories'}
+
+
+def pattern_family(batik_class):
+    name = str(batik_class).lower()
+    if 'bunga' in name or 'raya' in name:
+        return 'bunga_raya'
+    if 'geometri' in name:
+        return 'geometri'
+    return None
+
+
+def confidence_bucket(confidence):
+    """The displayed confidence, in 0.1% steps (rounded, as ``:.1f`` would)"""
+    return min(CONFIDENCE_BUCKETS, max(0, round(confidence * CONFIDENCE_BUCKETS)))
+
+
+def compile_template(family, fields):
+    """One format string for a card of ``family`` whose story has ``fields``"""
+    parts = [
+        '<div class="pattern-card">',
+        '<h3 style="color: #2E7D32; margin-bottom: 0.5rem;">{name}</h3>',
+        '<span class="confidence-badge {badge}">Confidence: {confidence}%</span>',
+    ]
+    for title, field in COMMON_SECTIONS + FAMILY_SECTIONS.get(family, []):
+        if field in fields:
+            style = ' style="white-space: pre-line;"' if field in PRE_LINE_FIELDS else ''
+            parts.append(f'<h4 class="section-header">{title}</h4>')
+            parts.append(f'<p class="info-text"{style}>{{{field}}}</p>')
+    parts.append('</div>')
+    return "".join(parts)
+
+
+class StoryCardRenderer:
+    """LRU cache of rendered cards in front of the compiled templates"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_CARDS):
+        self.max_entries = max_entries
+        self._templates = {}
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _template(self, family, fields):
+        key = (family, fields)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = compile_template(family, fields)
+        return template
+
+    def render(self, batik_class, language, confidence, story_data):
+        """HTML for one card; returns (html, served_from_cache)"""
+        bucket = confidence_bucket(confidence)
+        # The badge follows the exact confidence: 79.96% shows as 80.0% but is not "high"
+        high = confidence * 100 > HIGH_CONFIDENCE_PERCENT
+        key = (batik_class, language, bucket, high)
+        with self._lock:
+            html = self._cards.get(key)
+            if html is not None:
+                self._cards.move_to_end(key)
+                self.hits += 1
+                return html, True
+            self.misses += 1
+
+        fields = frozenset(field for field, value in story_data.items() if isinstance(value, str))
+        template = self._template(pattern_family(batik_class), fields)
+        html = template.format(
+            badge="confidence-high" if high else "confidence-medium",
+            confidence=f"{bucket * 100 / CONFIDENCE_BUCKETS:.1f}",
+            **{field: story_data[field] for field in fields}
+        )
+
+        with self._lock:
+            if self.max_entries > 0:
+                self._cards[key] = html
+                while len(self._cards) > self.max_entries:
+                    self._cards.popitem(last=False)
+                    self.evictions += 1
+        return html, False
+
+    def clear(self):
+        with self._lock:
+            self._cards.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._cards),
+                'max_entries': self.max_entries,
+                'templates': len(self._templates),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_card_renderer():
+    """Return the card renderer shared by every session in this process"""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = StoryCardRenderer()
+    return _renderer
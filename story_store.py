@@ -0,0 +1,145 @@
+# story_store.py
+import json
+import os
+import threading
+
+STORIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stories")
+
+# Unknown class names resolved by keyword are remembered, up to this many
+MAX_MEMOIZED_NAMES = 4096
+
+
+def normalize(name):
+    """Canonical form used for every alias lookup"""
+    return " ".join(str(name).lower().replace("_", " ").split())
+
+
+class StoryStore:
+    """Batik stories loaded from ``stories/<lang>.json`` on first use.
+
+    ``stories/index.json`` lists every pattern with its model class IDs,
+    aliases and keywords, plus the supported languages and their fallback
+    chains. Class names are resolved to a pattern through a precomputed
+    alias dict, and each language table is built once with its fallbacks
+    already applied, so a lookup is two dict reads however many motifs
+    there are.
+    """
+
+    def __init__(self, directory=STORIES_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+
+        self.default_language = index.get("default_language", "en")
+        self.languages = index.get("languages", {})
+        self._fallbacks = index.get("fallbacks", {})
+        self.patterns = list(index.get("patterns", {}))
+
+        self._aliases = {}
+        self._class_ids = {}
+        self._keywords = []
+        for pattern, entry in index.get("patterns", {}).items():
+            self._aliases[normalize(pattern)] = pattern
+            for alias in entry.get("aliases", []):
+                self._aliases.setdefault(normalize(alias), pattern)
+            for class_id in entry.get("class_ids", []):
+                self._class_ids[int(class_id)] = pattern
+            for keyword in entry.get("keywords", []):
+                self._keywords.append((normalize(keyword), pattern))
+
+        self._memo = {}
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def register_classes(self, class_names):
+        """Add a model's class names/IDs (``model.names``) to the alias index"""
+        for class_id, name in dict(class_names).items():
+            pattern = self.resolve(name)
+            if pattern is not None:
+                self._aliases[normalize(name)] = pattern
+                self._class_ids.setdefault(int(class_id), pattern)
+
+    def resolve(self, batik_class):
+        """Pattern key for a class name or class ID, or None if unknown"""
+        if isinstance(batik_class, int):
+            return self._class_ids.get(batik_class)
+
+        key = normalize(batik_class)
+        pattern = self._aliases.get(key)
+        if pattern is not None or key in self._memo:
+            return pattern or self._memo[key]
+
+        # Names outside the index: keyword match once, then remember
+        pattern = next((p for keyword, p in self._keywords if keyword in key), None)
+        if len(self._memo) < MAX_MEMOIZED_NAMES:
+            self._memo[key] = pattern
+        return pattern
+
+    def _read_language(self, language):
+        path = os.path.join(self.directory, f"{language}.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _chain(self, language):
+        chain = [language] + list(self._fallbacks.get(language, []))
+        if self.default_language not in chain:
+            chain.append(self.default_language)
+        return chain
+
+    def table(self, language):
+        """Stories for ``language`` with fallbacks resolved, loaded on first use"""
+        table = self._tables.get(language)
+        if table is not None:
+            return table
+
+        with self._lock:
+            table = self._tables.get(language)
+            if table is None:
+                files = [self._read_language(lang) for lang in self._chain(language)]
+                patterns = {}
+                default = None
+                # Walk the chain from the least to the most preferred language
+                for data in reversed(files):
+                    patterns.update(data.get("patterns", {}))
+                    default = data.get("default", default)
+                table = {'patterns': patterns, 'default': default or {}}
+                self._tables[language] = table
+        return table
+
+    def story(self, batik_class, language):
+        """Story dict for a detected class, or the generic story if unknown"""
+        table = self.table(language)
+        pattern = self.resolve(batik_class)
+        if pattern is not None:
+            story = table['patterns'].get(pattern)
+            if story is not None:
+                return story
+        return self.default_story(batik_class, language)
+
+    def default_story(self, batik_class, language):
+        template = self.table(language)['default']
+        return {field: text.format(batik_class=batik_class) for field, text in template.items()}
+
+    def iter_stories(self, languages=None):
+        """(pattern, language, story) for every indexed pattern and language"""
+        for pattern in self.patterns:
+            for language in languages or self.languages:
+                story = self.table(language)['patterns'].get(pattern)
+                if story is not None:
+                    yield pattern, language, story
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_story_store():
+    """Return the story store shared by every session in this process"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = StoryStore()
+    return _store
@@ -0,0 +1,281 @@
+# stream_mode.py
+"""Live camera / video classification for gallery installations.
+
+    python stream_mode.py --source 0                 # first webcam
+    python stream_mode.py --source fabric_walk.mp4   # a video file
+
+A reader thread always holds only the newest frame, and the inference
+worker takes whatever is newest when it becomes free. Frames that arrive
+while the model is busy are skipped, so the stream never falls behind the
+camera however slow the CPU is. Predictions are averaged over a sliding
+window and the displayed label only changes once a new label has been on
+top for several updates in a row.
+"""
+import argparse
+import collections
+import sys
+import threading
+import time
+
+import numpy as np
+
+import metrics
+
+DEFAULT_WINDOW = 8
+DEFAULT_STABLE_UPDATES = 4
+DEFAULT_MIN_CONFIDENCE = 0.6
+# Seconds without a keepalive() before the UI's stream shuts itself down
+DEFAULT_IDLE_TIMEOUT = 10.0
+
+
+def open_source(source):
+    """cv2.VideoCapture for a camera index ("0") or a video path"""
+    import cv2
+
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open video source: {source}")
+    return capture
+
+
+def frame_to_model_array(frame, model_size):
+    """Resize a BGR camera frame so its shorter side matches the model input"""
+    import cv2
+
+    height, width = frame.shape[:2]
+    shortest = min(height, width)
+    if shortest <= model_size:
+        return np.ascontiguousarray(frame)
+    scale = model_size / shortest
+    return cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+class LabelSmoother:
+    """Sliding-window average of class probabilities with a stability gate"""
+
+    def __init__(self, window=DEFAULT_WINDOW, stable_updates=DEFAULT_STABLE_UPDATES,
+                 min_confidence=DEFAULT_MIN_CONFIDENCE):
+        self.window = collections.deque(maxlen=window)
+        self.stable_updates = stable_updates
+        self.min_confidence = min_confidence
+        self.stable_label = None
+        self.stable_confidence = 0.0
+        self._candidate = None
+        self._candidate_count = 0
+
+    def update(self, probs):
+        """Add one prediction; returns True if the stable label changed"""
+        self.window.append(np.asarray(probs, dtype=np.float32))
+        mean = np.mean(self.window, axis=0)
+        label = int(mean.argmax())
+        confidence = float(mean[label])
+
+        if label == self.stable_label:
+            self.stable_confidence = confidence
+            self._candidate, self._candidate_count = None, 0
+            return False
+
+        if label == self._candidate:
+            self._candidate_count += 1
+        else:
+            self._candidate, self._candidate_count = label, 1
+
+        if self._candidate_count >= self.stable_updates and confidence >= self.min_confidence:
+            self.stable_label = label
+            self.stable_confidence = confidence
+            self._candidate, self._candidate_count = None, 0
+            return True
+        return False
+
+
+class StreamClassifier:
+    """Reads frames on one thread and classifies the newest on another.
+
+    With ``idle_timeout`` set, the stream stops itself (releasing the
+    camera) once nobody has called ``keepalive`` for that many seconds, e.g.
+    because the browser tab showing it was closed.
+    """
+
+    def __init__(self, storyteller, source, smoother=None, fps_window=30, idle_timeout=None):
+        self.storyteller = storyteller
+        self.source = source
+        self.smoother = smoother or LabelSmoother()
+        self.idle_timeout = idle_timeout
+        self.frames_read = 0
+        self.frames_processed = 0
+        self.last_frame = None
+        self.last_error = None
+        self._latest = None
+        self._latest_ready = threading.Condition()
+        self._running = False
+        self._threads = []
+        self._latencies = collections.deque(maxlen=fps_window)
+        self._processed_at = collections.deque(maxlen=fps_window)
+        self._on_change = []
+        self._last_keepalive = time.perf_counter()
+
+    def on_label_change(self, callback):
+        """Call ``callback(class_name, confidence)`` whenever the stable label switches"""
+        self._on_change.append(callback)
+
+    def start(self):
+        self._capture = open_source(self.source)
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._read_loop, name="stream-reader", daemon=True),
+            threading.Thread(target=self._infer_loop, name="stream-inference", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Stop both threads; the reader releases the capture on its way out"""
+        self._running = False
+        with self._latest_ready:
+            self._latest_ready.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+
+    def keepalive(self):
+        """Tell an ``idle_timeout`` stream that someone is still watching"""
+        self._last_keepalive = time.perf_counter()
+
+    @property
+    def running(self):
+        return self._running
+
+    def _read_loop(self):
+        source_fps = self._capture.get(5) or 0.0  # cv2.CAP_PROP_FPS
+        is_file = not str(self.source).isdigit()
+        try:
+            while self._running:
+                if self.idle_timeout and time.perf_counter() - self._last_keepalive > self.idle_timeout:
+                    self._running = False
+                    break
+                ok, frame = self._capture.read()
+                if not ok:
+                    # End of a video file (or a camera that went away)
+                    self._running = False
+                    break
+                self.frames_read += 1
+                with self._latest_ready:
+                    # Overwrite: frames the worker did not get to are skipped
+                    self._latest = (time.perf_counter(), frame)
+                    self._latest_ready.notify()
+                if is_file and source_fps > 0:
+                    # Play files back in real time rather than as fast as we can decode
+                    time.sleep(1.0 / source_fps)
+        finally:
+            # Only this thread reads from the capture, so it is the one to release it
+            self._capture.release()
+            with self._latest_ready:
+                self._latest_ready.notify_all()
+
+    def _infer_loop(self):
+        from inference_pool import InferenceBusy, get_inference_pool
+
+        pool = get_inference_pool()
+        model = self.storyteller.model
+        model_size = self.storyteller.model_size
+        while self._running:
+            with self._latest_ready:
+                while self._latest is None and self._running:
+                    self._latest_ready.wait(timeout=0.5)
+                if self._latest is None:
+                    break
+                captured_at, frame = self._latest
+                self._latest = None
+
+            try:
+                array = frame_to_model_array(frame, model_size)
+                # Through the shared pool, so a live stream takes turns with uploads
+                result = pool.run(model.predict, array, verbose=False, stage="predict_stream")[0]
+                probs = result.probs.data
+                probs = probs.cpu().numpy() if hasattr(probs, 'cpu') else np.asarray(probs)
+            except InferenceBusy:
+                # The pool is saturated: drop this frame, the next one is newer anyway
+                metrics.inc("batik_stream_frames_dropped_total")
+                continue
+            except Exception as e:
+                self.last_error = e
+                continue
+
+            now = time.perf_counter()
+            self.frames_processed += 1
+            self.last_frame = frame
+            self._latencies.append(now - captured_at)
+            self._processed_at.append(now)
+            metrics.observe("batik_stream_latency_seconds", now - captured_at)
+            metrics.inc("batik_stream_frames_total")
+
+            if self.smoother.update(probs):
+                class_name = self.label_name(self.smoother.stable_label)
+                for callback in self._on_change:
+                    callback(class_name, self.smoother.stable_confidence)
+
+    def label_name(self, class_id):
+        if class_id is None:
+            return None
+        return self.storyteller.class_names.get(class_id, f"Class_{class_id}")
+
+    def stats(self):
+        """Sustained FPS, end-to-end latency and how many frames were skipped"""
+        fps = 0.0
+        if len(self._processed_at) > 1:
+            span = self._processed_at[-1] - self._processed_at[0]
+            fps = (len(self._processed_at) - 1) / span if span > 0 else 0.0
+        latencies = sorted(self._latencies)
+        return {
+            'fps': fps,
+            'latency_ms_p50': latencies[len(latencies) // 2] * 1000.0 if latencies else None,
+            'latency_ms_max': latencies[-1] * 1000.0 if latencies else None,
+            'frames_read': self.frames_read,
+            'frames_processed': self.frames_processed,
+            'frames_skipped': max(0, self.frames_read - self.frames_processed),
+            'label': self.label_name(self.smoother.stable_label),
+            'confidence': self.smoother.stable_confidence,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify batik from a camera or video in real time")
+    parser.add_argument("--source", default="0", help="Camera index or video file")
+    parser.add_argument("--model", default="best.pt")
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    parser.add_argument("--stable-updates", type=int, default=DEFAULT_STABLE_UPDATES)
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE)
+    args = parser.parse_args(argv)
+
+    from Batik_Web_App_Test import BatikStoryTeller
+
+    storyteller = BatikStoryTeller(model_path=args.model)
+    if storyteller.model is None:
+        print("Streaming needs the model; none could be loaded")
+        return 1
+
+    stream = StreamClassifier(
+        storyteller, args.source, LabelSmoother(args.window, args.stable_updates, args.min_confidence)
+    )
+    stream.on_label_change(lambda name, confidence: print(
+        f"\n→ {storyteller.get_story(name, args.lang)['name']} ({confidence * 100:.0f}%)"
+    ))
+    stream.start()
+    try:
+        while stream.running:
+            time.sleep(1.0)
+            stats = stream.stats()
+            latency = stats['latency_ms_p50']
+            print(f"\r{stats['fps']:5.1f} FPS | latency {latency or 0:6.1f} ms | "
+                  f"skipped {stats['frames_skipped']:5d}", end="", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.stop()
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# tiling.py
+import numpy as np
+from PIL import Image
+
+DEFAULT_TILE_SIZE = 448
+DEFAULT_STRIDE = 224
+DEFAULT_TILE_BATCH = 16
+
+# Overlay colours per class ID (RGB); classes beyond these cycle
+PATTERN_COLOURS = [
+    (229, 57, 53),    # Bunga Raya - hibiscus red
+    (30, 136, 229),   # Geometri - blue
+    (67, 160, 71),
+    (251, 140, 0),
+    (142, 36, 170),
+    (0, 172, 193),
+]
+
+
+def tile_positions(length, tile, stride):
+    """Start offsets along one axis, always including the far edge"""
+    if length <= tile:
+        return [0]
+    positions = list(range(0, length - tile + 1, stride))
+    if positions[-1] != length - tile:
+        positions.append(length - tile)
+    return positions
+
+
+def tile_views(scan, tile=DEFAULT_TILE_SIZE, stride=DEFAULT_STRIDE):
+    """Yield (row, col, y, x, view) for overlapping tiles.
+
+    Every tile is a basic slice of ``scan``, i.e. a zero-copy NumPy view;
+    nothing is copied until the model preprocesses a batch.
+    """
+    height, width = scan.shape[:2]
+    tile = min(tile, height, width)
+    for row, y in enumerate(tile_positions(height, tile, stride)):
+        for col, x in enumerate(tile_positions(width, tile, stride)):
+            yield row, col, y, x, scan[y:y + tile, x:x + tile]
+
+
+def classify_tiles(model, scan, tile=DEFAULT_TILE_SIZE, stride=DEFAULT_STRIDE, batch_size=DEFAULT_TILE_BATCH,
+                   predict=None):
+    """Run every tile through ``model`` in batches and return the probability grid.
+
+    Only ``batch_size`` tiles are in flight at once, so memory is bounded by
+    the decoded scan plus one batch regardless of how many tiles there are.
+    ``predict(batch)`` replaces ``model.predict`` for each batch, e.g. to
+    send every batch through the inference pool separately.
+    Returns (grid, positions, tile) where grid has shape (rows, cols, classes).
+    """
+    if predict is None:
+        predict = lambda tiles: model.predict(tiles, verbose=False)
+    height, width = scan.shape[:2]
+    tile = min(tile, height, width)
+    rows = len(tile_positions(height, tile, stride))
+    cols = len(tile_positions(width, tile, stride))
+
+    grid = None
+    positions = np.zeros((rows, cols, 2), dtype=np.int32)
+    batch = []
+    batch_cells = []
+
+    def flush():
+        nonlocal grid
+        results = predict(batch)
+        for (row, col), result in zip(batch_cells, results):
+            probs = result.probs.data
+            probs = probs.cpu().numpy() if hasattr(probs, 'cpu') else np.asarray(probs)
+            if grid is None:
+                grid = np.zeros((rows, cols, probs.shape[-1]), dtype=np.float32)
+            grid[row, col] = probs
+        batch.clear()
+        batch_cells.clear()
+
+    for row, col, y, x, view in tile_views(scan, tile, stride):
+        positions[row, col] = (y, x)
+        batch.append(view)
+        batch_cells.append((row, col))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    return grid, positions, tile
+
+
+def area_share(grid):
+    """Fraction of tiles whose top class is each class ID"""
+    winners = grid.argmax(axis=-1)
+    counts = np.bincount(winners.ravel(), minlength=grid.shape[-1])
+    return counts / max(1, winners.size)
+
+
+def heatmap_overlay(thumbnail, grid, alpha=0.45):
+    """Blend a per-tile class colour map (confidence as opacity) over the thumbnail"""
+    winners = grid.argmax(axis=-1)
+    confidence = grid.max(axis=-1)
+    palette = np.array([PATTERN_COLOURS[i % len(PATTERN_COLOURS)] for i in range(grid.shape[-1])], dtype=np.uint8)
+
+    colours = Image.fromarray(palette[winners]).resize(thumbnail.size, Image.BILINEAR)
+    opacity = Image.fromarray((confidence * alpha * 255).astype(np.uint8)).resize(
+        thumbnail.size, Image.BILINEAR
+    )
+    base = thumbnail.convert("RGB")
+    return Image.composite(colours, base, opacity)
@@ -0,0 +1,224 @@
+# tts_backends.py
+import argparse
+import io
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+TTS_BACKEND_ENV = "BATIK_TTS_BACKEND"
+DEFAULT_BACKEND = "gtts"
+
+# Short enough that the first chunk comes back quickly, long enough to keep
+# the narration's intonation natural
+DEFAULT_CHUNK_CHARS = 220
+
+# Latin and CJK sentence endings (Chinese stories use 。！？)
+_SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s*')
+
+
+def split_sentences(text, max_chars=DEFAULT_CHUNK_CHARS):
+    """Split text into sentence-sized chunks of at most ``max_chars``"""
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        # Very long sentences are cut on whitespace (or hard, for CJK)
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TTSBackend:
+    """Base class: turn a chunk of text into audio bytes"""
+
+    name = None
+    extension = None
+    mime_type = None
+
+    def is_available(self):
+        return True
+
+    def synthesize(self, text, lang):
+        raise NotImplementedError
+
+    def join(self, chunks):
+        """Combine chunk audio into one playable file"""
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS (needs internet access)"""
+
+    name = "gtts"
+    extension = "mp3"
+    mime_type = "audio/mp3"
+
+    def is_available(self):
+        try:
+            import gtts  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def synthesize(self, text, lang):
+        from gtts import gTTS
+
+        audio_bytes = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(audio_bytes)
+        return audio_bytes.getvalue()
+
+    def join(self, chunks):
+        # MP3 is a stream of independent frames, so chunks concatenate cleanly
+        return b"".join(chunks)
+
+
+class EspeakBackend(TTSBackend):
+    """Local, offline synthesis with espeak-ng writing WAV"""
+
+    name = "espeak"
+    extension = "wav"
+    mime_type = "audio/wav"
+
+    VOICES = {
+        'en': 'en',
+        'ms': 'ms',
+        'zh-cn': 'cmn',
+    }
+
+    def __init__(self, executable=None):
+        self.executable = executable or shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def is_available(self):
+        return self.executable is not None
+
+    def synthesize(self, text, lang):
+        if self.executable is None:
+            raise RuntimeError("espeak-ng is not installed")
+        voice = self.VOICES.get(lang, lang)
+        completed = subprocess.run(
+            [self.executable, "-v", voice, "--stdout", text],
+            capture_output=True,
+            check=True,
+        )
+        return completed.stdout
+
+    def join(self, chunks):
+        if len(chunks) == 1:
+            return chunks[0]
+        output = io.BytesIO()
+        with wave.open(output, "wb") as joined:
+            for i, chunk in enumerate(chunks):
+                with wave.open(io.BytesIO(chunk), "rb") as part:
+                    if i == 0:
+                        joined.setparams(part.getparams())
+                    joined.writeframes(part.readframes(part.getnframes()))
+        return output.getvalue()
+
+
+BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    EspeakBackend.name: EspeakBackend,
+}
+
+_instances = {}
+
+
+def get_backend(name=None):
+    """Return the (shared) backend called ``name``, or the configured default"""
+    name = name or os.environ.get(TTS_BACKEND_ENV, DEFAULT_BACKEND)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TTS backend: {name}")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
+
+
+def available_backends():
+    """Names of the backends that can run on this machine"""
+    return [name for name in BACKENDS if get_backend(name).is_available()]
+
+
+def stream_synthesis(backend, text, lang, max_workers=4, max_chars=DEFAULT_CHUNK_CHARS):
+    """Synthesize chunks in parallel and yield their audio in reading order.
+
+    The first chunk is yielded as soon as it is ready, so playback can start
+    while the rest of the story is still being rendered.
+    """
+    chunks = split_sentences(text, max_chars)
+    if not chunks:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        futures = [pool.submit(backend.synthesize, chunk, lang) for chunk in chunks]
+        for future in futures:
+            yield future.result()
+
+
+def synthesize_chunked(backend, text, lang, **kwargs):
+    """Synthesize the whole text through the chunked path and join the result"""
+    return backend.join(list(stream_synthesis(backend, text, lang, **kwargs)))
+
+
+def measure_time_to_first_audio(backend, text, lang, **kwargs):
+    """Time how long a backend takes to produce its first and last chunk"""
+    start = time.perf_counter()
+    first = None
+    chunks = 0
+    audio_bytes = 0
+    for chunk in stream_synthesis(backend, text, lang, **kwargs):
+        if first is None:
+            first = time.perf_counter() - start
+        chunks += 1
+        audio_bytes += len(chunk)
+    return {
+        'backend': backend.name,
+        'time_to_first_audio': first,
+        'total_seconds': time.perf_counter() - start,
+        'chunks': chunks,
+        'audio_bytes': audio_bytes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure time-to-first-audio per TTS backend")
+    parser.add_argument("text", nargs="?", help="Text to read (defaults to the English Bunga Raya story)")
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--backend", action="append", choices=list(BACKENDS),
+                        help="Backend to measure (repeatable; default: every available one)")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    text = args.text
+    if text is None:
+        from audio_cache import narration_text
+        from story_store import get_story_store
+        text = narration_text(get_story_store().story("corak batik bunga raya", args.lang))
+
+    for name in args.backend or available_backends():
+        timing = measure_time_to_first_audio(get_backend(name), text, args.lang, max_workers=args.workers)
+        print(f"{name:8s} first audio {timing['time_to_first_audio']:.2f}s, "
+              f"total {timing['total_seconds']:.2f}s over {timing['chunks']} chunks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())